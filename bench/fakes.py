@@ -0,0 +1,358 @@
+"""
+Локальные заменители внешних сервисов для бенчмарков 🧪
+──────────────────────────────────────────────────────
+• FakeSupabase – in-memory таблицы с тем подмножеством API PostgREST-клиента,
+  которое использует бот (select/eq/neq/gt/gte/lte/not_.is_/order/limit/single,
+  insert/upsert/update/delete, storage.create_signed_url); daily_nutrition
+  пересчитывается при записи в meals, как триггер из sql/001_daily_nutrition.sql
+• FakeOpenAI – chat.completions.create с заданной задержкой и готовыми ответами
+• FakeBot / make_photo_update – минимальные объекты Telegram для обработчиков
+• seed – данные пользователя за N дней, seed_users – много пустых профилей
+"""
+import asyncio
+import io
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from PIL import Image
+from postgrest.exceptions import APIError
+
+# ───────────────────────── PostgREST ─────────────────────────
+
+class _Query:
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.columns = None
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+        self.single_row = False
+        self._negate = False
+
+    # чтение
+    def select(self, columns: str = "*", **_):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def _filter(self, column, check):
+        if self._negate:
+            self._negate = False
+            self.filters.append((column, lambda v: not check(v)))
+        else:
+            self.filters.append((column, check))
+        return self
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def is_(self, column, value):
+        return self._filter(column, lambda v: v is None if str(value) == "null" else v == value)
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v, x=str(value): str(v) == x)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v, x=str(value): str(v) != x)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v, x=str(value): v is not None and str(v) > x)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v, x=str(value): v is not None and str(v) >= x)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v, x=str(value): v is not None and str(v) <= x)
+
+    def order(self, column, desc=False, **_):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count, **_):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    # запись
+    def insert(self, payload, **_):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "", **_):
+        self.action, self.payload = "upsert", payload
+        self.on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        return self
+
+    def update(self, payload, **_):
+        self.action, self.payload = "update", payload
+        return self
+
+    def delete(self, **_):
+        self.action = "delete"
+        return self
+
+    def execute(self):
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            data = getattr(self, f"_{self.action}")(self.db.tables.setdefault(self.table, []))
+        if self.single_row:
+            if len(data) != 1:
+                raise APIError({"message": "JSON object requested, multiple (or no) rows returned", "code": "PGRST116"})
+            data = data[0]
+        return SimpleNamespace(data=data)
+
+    def _matches(self, row) -> bool:
+        return all(check(row.get(column)) for column, check in self.filters)
+
+    def _select(self, rows):
+        found = [row for row in rows if self._matches(row)]
+        for column, desc in reversed(self.ordering):
+            found.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.row_limit is not None:
+            found = found[:self.row_limit]
+        if self.columns:
+            return [{c: row.get(c) for c in self.columns} for row in found]
+        return [dict(row) for row in found]
+
+    def _insert(self, rows):
+        new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        inserted = []
+        for payload in new_rows:
+            row = {"id": str(uuid.uuid4()), "created_at": datetime.now().isoformat(), **payload}
+            rows.append(row)
+            inserted.append(dict(row))
+            self.db.after_write(self.table, row, +1)
+        return inserted
+
+    def _upsert(self, rows):
+        new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        result = []
+        for payload in new_rows:
+            key = [str(payload.get(c)) for c in self.on_conflict]
+            existing = next(
+                (row for row in rows if [str(row.get(c)) for c in self.on_conflict] == key), None
+            ) if self.on_conflict else None
+            if existing is None:
+                existing = {"id": str(uuid.uuid4()), "created_at": datetime.now().isoformat()}
+                rows.append(existing)
+            existing.update(payload)
+            result.append(dict(existing))
+        return result
+
+    def _update(self, rows):
+        updated = []
+        for row in rows:
+            if self._matches(row):
+                row.update(self.payload)
+                updated.append(dict(row))
+        return updated
+
+    def _delete(self, rows):
+        deleted = [row for row in rows if self._matches(row)]
+        rows[:] = [row for row in rows if not self._matches(row)]
+        for row in deleted:
+            self.db.after_write(self.table, row, -1)
+        return deleted
+
+class _Bucket:
+    def create_signed_url(self, path, expires_in):
+        return {"signedURL": f"https://storage.local/{path}?token=bench"}
+
+    def upload(self, path, file):
+        return {"Key": path}
+
+class FakeSupabase:
+    """Потокобезопасное in-memory хранилище с интерфейсом supabase.Client"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: dict[str, list[dict]] = {}
+        self.lock = threading.Lock()
+        self.storage = SimpleNamespace(from_=lambda bucket: _Bucket())
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def after_write(self, table: str, row: dict, sign: int) -> None:
+        """Аналог триггера meals → daily_nutrition"""
+        if table != "meals":
+            return
+        rollup = self.tables.setdefault("daily_nutrition", [])
+        day = next(
+            (r for r in rollup if r["user_id"] == row["user_id"] and r["date"] == row["date"]), None
+        )
+        if day is None:
+            day = {"user_id": row["user_id"], "date": row["date"],
+                   "calories": 0, "protein": 0.0, "fat": 0.0, "carbs": 0.0, "meal_count": 0}
+            rollup.append(day)
+        for column in ("calories", "protein", "fat", "carbs"):
+            day[column] += sign * (row.get(column) or 0)
+        day["meal_count"] += sign
+
+def seed(db: FakeSupabase, user_id: int, days: int, meals_per_day: int = 4) -> None:
+    """Профиль, вес/шаги, сожжённые ккал и приёмы пищи пользователя за days дней"""
+    rnd = random.Random(user_id)
+    uid = str(user_id)
+    db.table("users").upsert({
+        "user_id": uid, "weight": 82.0, "height": 180, "bodyfat": 18.0,
+        "gender": "Мужской", "deficit": 300
+    }, on_conflict="user_id").execute()
+
+    today = date.today()
+    daily, burned, meals = [], [], []
+    for offset in range(days):
+        d = str(today - timedelta(days=offset))
+        daily.append({"user_id": uid, "date": d,
+                      "weight": round(82 - offset * 0.05 + rnd.uniform(-0.3, 0.3), 1),
+                      "steps": rnd.randint(3000, 15000)})
+        burned.append({"user_id": uid, "date": d, "calories": rnd.randint(0, 400)})
+        for _ in range(meals_per_day):
+            meals.append({"user_id": uid, "date": d, "description": "гречка 150г, курица 120г",
+                          "calories": rnd.randint(200, 700), "protein": round(rnd.uniform(5, 40), 1),
+                          "fat": round(rnd.uniform(2, 30), 1), "carbs": round(rnd.uniform(10, 80), 1)})
+    db.table("Nutrition Bot").upsert(daily, on_conflict="user_id,date").execute()
+    db.table("burned_calories").upsert(burned, on_conflict="user_id,date").execute()
+    db.table("meals").insert(meals).execute()
+
+def seed_users(db: FakeSupabase, count: int, first_id: int = 10_000) -> None:
+    """Много пользователей без истории — для загрузки списка при старте"""
+    db.table("users").insert([
+        {"user_id": str(first_id + i), "weight": 75.0, "height": 175, "bodyfat": 20.0,
+         "gender": "Женский", "deficit": 0}
+        for i in range(count)
+    ]).execute()
+
+# ───────────────────────── OpenAI ─────────────────────────
+
+VISION_REPLY = "гречка 150г, куриная грудка 120г, огурец 80г"
+FOOD_REPLY = """{
+  "breakdown": [
+    {"item": "гречка 150г", "calories": 165, "protein": 6.0, "fat": 1.5, "carbs": 31.5},
+    {"item": "куриная грудка 120г", "calories": 196, "protein": 36.0, "fat": 3.2, "carbs": 0.0},
+    {"item": "огурец 80г", "calories": 12, "protein": 0.6, "fat": 0.1, "carbs": 2.4}
+  ],
+  "total": {"calories": 373, "protein": 43.0, "fat": 4.9, "carbs": 37.8}
+}"""
+
+# Доля задержки до первого фрагмента потокового ответа; остальное — равномерно по фрагментам
+STREAM_FIRST_CHUNK_SHARE = 0.2
+STREAM_CHUNK_CHARS = 24
+
+class FakeOpenAI:
+    """AsyncOpenAI с фиксированной задержкой ответа: vision — отдельно от текста"""
+
+    def __init__(self, text_latency: float = 0.8, vision_latency: float = 2.5):
+        self.text_latency = text_latency
+        self.vision_latency = vision_latency
+        self.calls = 0
+        # Что vision-модель «видит» на фото в режиме two_step
+        self.vision_reply = VISION_REPLY
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, messages, stream=False, **kwargs):
+        self.calls += 1
+        is_vision = any(isinstance(m.get("content"), list) for m in messages)
+        latency = self.vision_latency if is_vision else self.text_latency
+        # Vision со схемой ответа — разбор фото одним запросом (analyze_food_image)
+        content = self.vision_reply if is_vision and "response_format" not in kwargs else FOOD_REPLY
+        if stream:
+            return self._stream(content, latency)
+        await asyncio.sleep(latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    async def _stream(self, content: str, latency: float):
+        """Тот же ответ фрагментами (chunk.choices[0].delta.content), суммарно за latency"""
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        await asyncio.sleep(latency * STREAM_FIRST_CHUNK_SHARE)
+        step = latency * (1 - STREAM_FIRST_CHUNK_SHARE) / len(pieces)
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(step)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+# ───────────────────────── Telegram ─────────────────────────
+
+def make_jpeg(width: int = 1280, height: int = 960, seed_value: int = 0) -> bytes:
+    """Шумная картинка: JPEG примерно того же размера, что и реальные фото"""
+    rnd = random.Random(seed_value)
+    img = Image.effect_noise((width // 8, height // 8), 64).convert("RGB")
+    img = img.resize((width, height))
+    img.paste((rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)), (0, 0, width // 3, height // 3))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+class _FakeFile:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def download_to_memory(self, out):
+        out.write(self.data)
+
+class FakeMessage:
+    def __init__(self, bot: "FakeBot", *, text=None, caption=None, photo=()):
+        self.bot = bot
+        self.text = text
+        self.caption = caption
+        self.photo = list(photo)
+        self.message_id = random.randint(1, 1 << 30)
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(chat_id=0, text=text, **kwargs)
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self.bot.send_photo(chat_id=0, photo=photo, **kwargs)
+
+    async def edit_text(self, text, **kwargs):
+        self.bot.sent.append(text)
+        return self
+
+class FakeBot:
+    """Бот, который ничего не отправляет, но «скачивает» заданные файлы"""
+
+    def __init__(self, files: dict[str, bytes] | None = None, latency: float = 0.0):
+        self.files = files or {}
+        self.latency = latency
+        self.sent: list = []
+
+    async def get_file(self, file_id):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _FakeFile(self.files[file_id])
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return FakeMessage(self, text=text)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        self.sent.append(photo)
+        message = FakeMessage(self)
+        message.photo = [SimpleNamespace(file_id="sent", width=1200, height=800)]
+        return message
+
+def make_photo_update(bot: FakeBot, user_id: int, photo: bytes, caption: str | None = None):
+    """(update, ctx) для handle_photo: набор PhotoSize как у Telegram, скачивается только нужный"""
+    sizes = []
+    for side in (90, 320, 800, 1280):
+        file_id = f"photo-{side}"
+        bot.files.setdefault(file_id, photo)
+        sizes.append(SimpleNamespace(file_id=file_id, width=side, height=side * 3 // 4))
+    message = FakeMessage(bot, caption=caption, photo=sizes)
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=SimpleNamespace(id=user_id),
+                             message=message, effective_message=message)
+    application = SimpleNamespace(create_task=lambda coro, update=None: asyncio.create_task(coro))
+    ctx = SimpleNamespace(bot=bot, user_data={}, chat_data={}, application=application)
+    return update, ctx
@@ -0,0 +1,86 @@
+"""
+Профиль времени импорта бота 🐢
+──────────────────────────────
+Запускает `python -X importtime -c "import bot"` в отдельном процессе
+(с фиктивными ключами, как bench/run.py) и печатает JSON:
+общее время импорта, самые дорогие модули верхнего уровня и то,
+какие тяжёлые пакеты оказались загружены.
+
+  python bench/import_profile.py
+  python bench/import_profile.py --top 30 --module clients.charts_client
+
+Если какой-то пакет из --forbid (по умолчанию matplotlib, seaborn, pandas)
+импортируется при старте, код выхода 1 — графические зависимости должны
+грузиться лениво.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BENCH_ENV = {
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_ANON_KEY": "bench.bench.bench",
+    "SUPABASE_SERVICE_ROLE_KEY": "bench.bench.bench",
+    "OPENAI_API_KEY": "bench",
+    "FOOD_CACHE_PATH": ":memory:",
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def profile(module: str) -> tuple[list[tuple[int, int, str]], float]:
+    """[(собственное мкс, накопленное мкс, вложенность, имя)] и wall-clock время процесса"""
+    env = {**os.environ, **BENCH_ENV}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT / "src", env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return entries, wall
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Профиль импорта бота")
+    parser.add_argument("--module", default="bot")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--forbid", default="matplotlib,seaborn,pandas",
+                        help="пакеты, которые не должны импортироваться при старте")
+    args = parser.parse_args()
+
+    entries, wall = profile(args.module)
+    target = next((e for e in entries if e[3] == args.module), None)
+    loaded = {e[3] for e in entries}
+    forbidden = [name for name in args.forbid.split(",") if name and name in loaded]
+
+    top_level = sorted((e for e in entries if e[2] == 1), key=lambda e: e[1], reverse=True)
+    report = {
+        "module": args.module,
+        "import_ms": round(target[1] / 1000, 1) if target else None,
+        "process_wall_ms": round(wall * 1000, 1),
+        "modules_loaded": len(entries),
+        "top": [
+            {"module": name, "cumulative_ms": round(cum / 1000, 1), "self_ms": round(own / 1000, 1)}
+            for own, cum, _, name in top_level[:args.top]
+        ],
+        "forbidden_loaded": forbidden,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if forbidden else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
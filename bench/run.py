@@ -0,0 +1,230 @@
+"""
+Микро-бенчмарки горячих путей бота ⏱️
+────────────────────────────────────
+Запускаются без сети: Supabase заменён in-memory PostgREST (bench/fakes.py),
+OpenAI — заглушкой с фиксированной задержкой, Telegram — FakeBot.
+
+  python bench/run.py                          # все сценарии, JSON в stdout
+  python bench/run.py -k chart -n 50           # только графики, 50 итераций
+  python bench/run.py -o current.json --baseline baseline.json
+
+С --baseline сравниваются p95 одноимённых сценариев; если какой-то стал
+медленнее больше чем на --max-regression (по умолчанию 25 %), код выхода 1.
+
+Задержки заглушек (секунды): --db-latency, --llm-latency, --vision-latency.
+Время сценариев с OpenAI на заглушке — это сумма этих констант, то есть
+оно показывает только, сколько запросов идёт последовательно (например,
+handle_photo.vision_llm — два, handle_photo.vision_one_shot — один), а не
+реальную разницу в скорости моделей. Для неё есть --live-openai: запросы
+уходят в настоящий OpenAI (нужен OPENAI_API_KEY, запросы платные),
+фото лучше взять настоящее: --photo path/to/meal.jpg.
+
+  python bench/run.py -k handle_photo.vision --live-openai --photo meal.jpg -n 5
+Импорт модулей бота сеть не использует, клиенты Supabase/OpenAI подменяются
+заглушками до первого обращения.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "bench"))
+
+# Кэши и состояние бенчмарка — во временных файлах, без сетевых ключей
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_ANON_KEY", "bench.bench.bench")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench.bench.bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("FOOD_CACHE_PATH", ":memory:")
+
+USER_ID = 1001
+# Блюдо, которого нет в локальной таблице (clients/data/foods.csv) — считается через LLM
+LLM_CAPTION = "плов с бараниной 300г"
+
+@dataclass
+class Case:
+    name: str
+    func: object
+    reset: object = None
+    iterations: int | None = None
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+async def _call(func):
+    result = func()
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+async def run_case(case: Case, iterations: int, warmup: int) -> dict:
+    iterations = case.iterations or iterations
+    for _ in range(warmup):
+        if case.reset:
+            case.reset()
+        await _call(case.func)
+
+    samples = []
+    for _ in range(iterations):
+        if case.reset:
+            case.reset()
+        start = time.perf_counter()
+        await _call(case.func)
+        samples.append(time.perf_counter() - start)
+
+    total = sum(samples)
+    return {
+        "name": case.name,
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / total, 2) if total else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(_percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(samples, 0.95) * 1000, 3),
+    }
+
+def build_cases(args) -> list[Case]:
+    from fakes import FakeBot, FakeOpenAI, FakeSupabase, FOOD_REPLY, VISION_REPLY, make_jpeg, make_photo_update, seed, seed_users
+
+    from clients import charts_client, chatgpt_client, supabase_client
+    from clients.images import PhotoResultCache
+    from clients.result_cache import ResultCache
+    import bot
+
+    db = FakeSupabase(latency=args.db_latency)
+    seed(db, USER_ID, days=90)
+    seed_users(db, args.users)
+    llm = FakeOpenAI(text_latency=args.llm_latency, vision_latency=args.vision_latency)
+
+    supabase_client.supabase = db
+    supabase_client.supabase_admin = db
+    charts_client.supabase = db
+    if not args.live_openai:
+        chatgpt_client.client = llm
+
+    def reset_data_caches():
+        supabase_client.reset_caches()
+
+    def reset_llm_caches():
+        # ttl=0: каждый analyze_food — промах кэша и запрос к (фейковому) LLM
+        chatgpt_client.food_cache = ResultCache(":memory:", ttl=0, max_rows=1000)
+        bot.photo_cache = PhotoResultCache(max_size=0)
+        bot.photo_analysis_cache = PhotoResultCache(max_size=0)
+
+    telegram = FakeBot(latency=args.tg_latency)
+    photo = Path(args.photo).read_bytes() if args.photo else make_jpeg()
+
+    def photo_case(caption, mode="two_step", seen=VISION_REPLY):
+        async def run():
+            update, ctx = make_photo_update(telegram, USER_ID, photo, caption)
+            bot.PHOTO_ANALYSIS_MODE = mode
+            llm.vision_reply = seen
+            await bot.handle_photo(update, ctx)
+        return run
+
+    async def first_item():
+        # Время до первой позиции разбора при потоковом ответе (остаток ответа не ждём)
+        ready = asyncio.Event()
+        task = asyncio.create_task(chatgpt_client.analyze_food(LLM_CAPTION, on_item=lambda item: ready.set()))
+        await ready.wait()
+        task.cancel()
+
+    parsed_food = json.loads(FOOD_REPLY)
+    cases = [
+        Case("reconcile_total", lambda: chatgpt_client.reconcile_total(dict(parsed_food)), iterations=args.iterations * 100),
+        Case("send_summary.cold", lambda: bot.send_summary(USER_ID, telegram, target_date=date.today()), reset_data_caches),
+        Case("send_summary.warm", lambda: bot.send_summary(USER_ID, telegram, target_date=date.today())),
+        Case("handle_photo.caption", photo_case("гречка 150г, курица 120г"), reset_llm_caches),
+        Case("handle_photo.caption_llm", photo_case(LLM_CAPTION), reset_llm_caches),
+        Case("handle_photo.vision", photo_case(None), reset_llm_caches),
+        # Продукты с фото не нашлись в локальной таблице: vision + analyze_food против одного запроса.
+        # На заглушке разница — ровно одна --llm-latency (число последовательных запросов);
+        # с --live-openai vision_llm зависит от того, что модель увидит на фото
+        Case("handle_photo.vision_llm", photo_case(None, seen=LLM_CAPTION), reset_llm_caches),
+        Case("handle_photo.vision_one_shot", photo_case(None, mode="one_shot"), reset_llm_caches),
+        Case("analyze_food.stream_first_item", first_item, reset_llm_caches),
+        Case(f"load_scheduled_users.{args.users}", bot.load_scheduled_users, bot.scheduled_users.clear),
+    ]
+    for days in (7, 30, 90):
+        cases.append(Case(f"get_nutrition_data.{days}d", lambda d=days: charts_client.get_nutrition_data(USER_ID, d)))
+    for kind, create in (
+        ("weight", charts_client.create_weight_chart),
+        ("calories", charts_client.create_calories_chart),
+        ("macros", charts_client.create_macros_chart),
+        ("activity", charts_client.create_activity_chart),
+    ):
+        cases.append(Case(f"create_{kind}_chart.30d", lambda c=create: c(USER_ID, 30), reset_data_caches))
+    return cases
+
+def compare(results: list[dict], baseline_path: str, max_regression: float) -> list[str]:
+    baseline = {r["name"]: r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if old and old["p95_ms"] and result["p95_ms"] > old["p95_ms"] * (1 + max_regression):
+            regressions.append(f'{result["name"]}: p95 {old["p95_ms"]} → {result["p95_ms"]} ms')
+    return regressions
+
+async def main(args) -> int:
+    cases = [c for c in build_cases(args) if not args.k or args.k in c.name]
+    results = []
+    for case in cases:
+        results.append(await run_case(case, args.iterations, args.warmup))
+        print(f"{case.name}: p50 {results[-1]['p50_ms']} ms, p95 {results[-1]['p95_ms']} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "db_latency": args.db_latency,
+            "llm_latency": args.llm_latency,
+            "vision_latency": args.vision_latency,
+            "tg_latency": args.tg_latency,
+            "live_openai": args.live_openai,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        for line in regressions:
+            print(f"❌ regression: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки бота с локальными заглушками")
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("-k", help="запускать только сценарии, содержащие подстроку")
+    parser.add_argument("-o", "--output", help="файл для JSON-отчёта (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="JSON-отчёт прошлого запуска для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--vision-latency", type=float, default=0.15)
+    parser.add_argument("--tg-latency", type=float, default=0.02)
+    parser.add_argument("--users", type=int, default=5000, help="пользователей для load_scheduled_users")
+    parser.add_argument("--live-openai", action="store_true",
+                        help="настоящий OpenAI вместо заглушки (OPENAI_API_KEY, платные запросы)")
+    parser.add_argument("--photo", help="JPEG для сценариев handle_photo (по умолчанию — сгенерированный шум)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
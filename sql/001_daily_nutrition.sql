@@ -0,0 +1,67 @@
+-- Дневные итоги питания (user_id, date → калории/БЖУ/количество приемов пищи).
+-- Поддерживаются триггером на meals в той же транзакции, что и запись/удаление еды,
+-- поэтому get_nutrition_for_date читает одну строку вместо суммирования всех meals за день.
+
+create table if not exists daily_nutrition (
+    user_id    text    not null,
+    date       date    not null,
+    calories   integer not null default 0,
+    protein    numeric not null default 0,
+    fat        numeric not null default 0,
+    carbs      numeric not null default 0,
+    meal_count integer not null default 0,
+    primary key (user_id, date)
+);
+
+-- security definer: триггер пишет в daily_nutrition от имени владельца функции, поэтому
+-- search_path закреплён — иначе вызывающий мог бы подменить daily_nutrition своей таблицей
+create or replace function apply_meal_to_daily_nutrition() returns trigger
+language plpgsql security definer
+set search_path = public, pg_temp
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        update daily_nutrition set
+            calories   = calories - coalesce(old.calories, 0),
+            protein    = protein  - coalesce(old.protein, 0),
+            fat        = fat      - coalesce(old.fat, 0),
+            carbs      = carbs    - coalesce(old.carbs, 0),
+            meal_count = meal_count - 1
+        where user_id = old.user_id and date = old.date;
+    end if;
+
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into daily_nutrition as d (user_id, date, calories, protein, fat, carbs, meal_count)
+        values (new.user_id, new.date, coalesce(new.calories, 0), coalesce(new.protein, 0),
+                coalesce(new.fat, 0), coalesce(new.carbs, 0), 1)
+        on conflict (user_id, date) do update set
+            calories   = d.calories + excluded.calories,
+            protein    = d.protein  + excluded.protein,
+            fat        = d.fat      + excluded.fat,
+            carbs      = d.carbs    + excluded.carbs,
+            meal_count = d.meal_count + 1;
+    end if;
+
+    return null;
+end;
+$$;
+
+begin;
+-- Блокируем запись в meals, чтобы триггер и заполнение не разошлись
+lock table meals in share row exclusive mode;
+
+drop trigger if exists meals_daily_nutrition on meals;
+create trigger meals_daily_nutrition
+    after insert or update or delete on meals
+    for each row execute function apply_meal_to_daily_nutrition();
+
+-- Заполняем итоги по уже существующим записям
+insert into daily_nutrition (user_id, date, calories, protein, fat, carbs, meal_count)
+select user_id, date,
+       coalesce(sum(calories), 0), coalesce(sum(protein), 0),
+       coalesce(sum(fat), 0), coalesce(sum(carbs), 0), count(*)
+from meals
+group by user_id, date
+on conflict (user_id, date) do nothing;
+
+commit;
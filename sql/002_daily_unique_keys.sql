@@ -0,0 +1,60 @@
+-- Уникальный ключ (user_id, date) для дневных значений, чтобы save_weight,
+-- save_steps, save_burned_calories и save_daily_values_bulk делали один upsert
+-- (on_conflict=user_id,date) вместо select + update/insert.
+--
+-- Дубликаты появлялись из-за гонки select + insert, поэтому строки одного дня
+-- могут хранить разные поля (в одной вес, в другой шаги). Перед удалением
+-- лишних строк группа сливается в одну: для каждого поля берётся последнее
+-- непустое значение. Отдельной метки времени в таблицах нет, «последнее» —
+-- по ctid (новые версии строк обычно пишутся физически позже). Калории в
+-- burned_calories приложение перезаписывает, а не суммирует, поэтому тоже
+-- берётся последнее значение.
+
+begin;
+
+-- Без записей на время миграции, чтобы не появились новые дубликаты
+lock table "Nutrition Bot" in share row exclusive mode;
+lock table burned_calories in share row exclusive mode;
+
+create temporary table nutrition_bot_merge on commit drop as
+select user_id, date,
+       (array_agg(id order by ctid desc))[1] as keep_id,
+       (array_agg(weight order by ctid desc) filter (where weight is not null))[1] as weight,
+       (array_agg(steps order by ctid desc) filter (where steps is not null))[1] as steps
+from "Nutrition Bot"
+group by user_id, date
+having count(*) > 1;
+
+update "Nutrition Bot" n
+set weight = m.weight, steps = m.steps
+from nutrition_bot_merge m
+where n.id = m.keep_id;
+
+delete from "Nutrition Bot" n
+using nutrition_bot_merge m
+where n.user_id = m.user_id and n.date = m.date and n.id <> m.keep_id;
+
+create temporary table burned_calories_merge on commit drop as
+select user_id, date,
+       (array_agg(id order by ctid desc))[1] as keep_id,
+       (array_agg(calories order by ctid desc) filter (where calories is not null))[1] as calories
+from burned_calories
+group by user_id, date
+having count(*) > 1;
+
+update burned_calories b
+set calories = m.calories
+from burned_calories_merge m
+where b.id = m.keep_id;
+
+delete from burned_calories b
+using burned_calories_merge m
+where b.user_id = m.user_id and b.date = m.date and b.id <> m.keep_id;
+
+alter table "Nutrition Bot"
+    add constraint nutrition_bot_user_id_date_key unique (user_id, date);
+
+alter table burned_calories
+    add constraint burned_calories_user_id_date_key unique (user_id, date);
+
+commit;
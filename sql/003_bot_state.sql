@@ -0,0 +1,13 @@
+-- Состояние бота (user_data, chat_data, шаги ConversationHandler'ов) для
+-- SupabasePersistence: переживает деплой и перезапуск дино, в отличие от
+-- локального файла. value — pickle в base64, пишется пакетами раз в несколько секунд.
+
+create table if not exists bot_state (
+    namespace text not null,
+    key       text not null,
+    value     text not null,
+    primary key (namespace, key)
+);
+
+-- Политик нет: таблицу читает и пишет только бот с service role ключом
+alter table bot_state enable row level security;
@@ -14,10 +14,16 @@
 """
 
 # ────────────────────────── Imports ───────────────────────────
+from time import monotonic
+STARTED_AT = monotonic()  # для замера времени до первого апдейта
+
+import io
+import logging
 import os
 import random
 import asyncio
 import re
+from contextlib import suppress
 from datetime import datetime, timedelta, date, time
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
@@ -25,23 +31,34 @@ from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram import File as TelegramFile
 from telegram.ext import (
     ApplicationBuilder, ContextTypes, filters,
-    ConversationHandler, CommandHandler, MessageHandler
+    ConversationHandler, CommandHandler, MessageHandler, PersistenceInput, TypeHandler
 )
-from telegram.error import TelegramError
+from telegram.error import BadRequest, TelegramError
 
 from clients.chatgpt_client import ( 
-    analyze_food, detect_food_items_from_image, is_detailed_description
+    analyze_food, analyze_food_image, detect_food_items_from_image, is_detailed_description
 )
-from clients.supabase_client import (
+from clients.images import PHOTO_DECODE_ERRORS, PhotoResultCache, pick_photo_size, prepare_photo, to_data_url
+from clients.supabase_async import (
     save_meal, save_weight, save_steps,
     get_last_weight, get_nutrition_for_date, get_steps_for_date,
     steps_exist_for_date, user_exists, save_user_data,
-    get_user_targets, get_user_profile, supabase,
+    get_user_targets, get_user_profile, get_user_ids_page,
     save_burned_calories, get_burned_calories, get_image_url,
-    init_storage, set_deficit_mode, has_meals_in_timerange,
+    set_deficit_mode, has_meals_in_timerange,
     get_meals_for_date, delete_meal, get_meal_by_id,
-    save_favorite_meal, get_favorite_meals, use_favorite_meal, delete_favorite_meal  # НОВЫЕ ФУНКЦИИ
+    save_favorite_meal, get_favorite_meals, use_favorite_meal,  # НОВЫЕ ФУНКЦИИ
+    check_connection, init_storage
+)
+
+from clients.log import setup_logging
+from clients.metrics import (
+    STARTUP_SECONDS, instrument_application, instrument_callback, observe, start_metrics_server, timed
 )
+from clients.webhook_server import run_webhook, WEBHOOK_QUEUE_SIZE
+from clients.persistence import SQLitePersistence, SupabasePersistence
+from clients.supabase_client import supabase_admin
+from clients.rate_limiter import TelegramRateLimiter, broadcast_priority
 
 from clients.messages import (
     STEPS_REMINDER_YESTERDAY,
@@ -52,12 +69,28 @@ from clients.messages import (
 
 from clients.charts_client import (
     create_weight_chart, create_calories_chart, 
-    create_macros_chart, create_activity_chart, 
-    cleanup_temp_files
+    create_macros_chart, create_activity_chart,
+    chart_cache_key, get_cached_chart, remember_chart, forget_chart,
+    warm_up as warm_up_charts
 )
 
 load_dotenv()
+log = logging.getLogger(__name__)
 TOKEN = os.getenv("TOKEN")
+# polling — для разработки, webhook — для web-дино (см. clients/webhook_server.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# user_data и состояния диалогов между перезапусками хранятся в таблице bot_state
+# в Supabase (sql/003_bot_state.sql); PERSISTENCE_PATH — вместо неё файл SQLite
+# (для разработки или постоянного тома: файловая система дино очищается при рестарте)
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH")
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+# Через сколько секунд после старта прогревать графики (отрицательное — не прогревать)
+CHART_WARMUP_DELAY = float(os.getenv("CHART_WARMUP_DELAY", "5"))
+# Не чаще скольких секунд править сообщение с разбором, пока ответ модели ещё идёт
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "1"))
+# Фото без подробной подписи: two_step — vision-модель называет продукты, затем analyze_food;
+# one_shot — КБЖУ по фото одним запросом (analyze_food_image)
+PHOTO_ANALYSIS_MODE = os.getenv("PHOTO_ANALYSIS_MODE", "two_step")
 ZONE = ZoneInfo("Europe/Vilnius")
 
 ASK_WEIGHT, ASK_HEIGHT, ASK_GENDER, ASK_FAT, ASK_DEFICIT_MODE, CONFIRM_HELP, INPUT_WEIGHT_TODAY, INPUT_WEIGHT_YESTERDAY, INPUT_STEPS_TODAY, INPUT_STEPS_YESTERDAY, INPUT_BURN, CHANGE_DEFICIT_MODE, WEIGHT_MENU, STEPS_MENU, DELETE_MENU, DELETE_CONFIRM, SAVE_FAVORITE_MENU, FAVORITE_MEALS_MENU, FAVORITE_MEAL_SELECT, CHARTS_MENU = range(20)
@@ -137,6 +170,19 @@ charts_keyboard = [
     ["🔙 Назад в меню"]
 ]
 charts_markup = ReplyKeyboardMarkup(charts_keyboard, resize_keyboard=True)
+
+# Кнопка → (вид графика, дней, функция построения, подпись)
+CHARTS = {
+    "📉 График веса": ("weight", 30, create_weight_chart, "📉 Динамика веса за 30 дней"),
+    "🔥 График калорий": ("calories", 7, create_calories_chart, "🔥 Калории за 7 дней"),
+    "🥗 Баланс БЖУ": ("macros", 7, create_macros_chart, "🥗 Баланс БЖУ за 7 дней"),
+    "👣 Активность": ("activity", 7, create_activity_chart, "👣 Активность за 7 дней"),
+}
+
+# Результаты распознавания уже виденных фото (ключ — пользователь и перцептивный хэш):
+# строка продуктов в режиме two_step и готовый разбор КБЖУ в режиме one_shot
+photo_cache = PhotoResultCache()
+photo_analysis_cache = PhotoResultCache()
 # ─────────────────── Helpers ──────────────────────────
 def now_vilnius():
     return datetime.now(ZONE)
@@ -164,7 +210,7 @@ def get_weight_trend_emoji(old_weight: float, new_weight: float) -> str:
 # ─────────────────── Анкета ────────────────────────────
 async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    if not user_exists(uid):
+    if not await user_exists(uid):
         await update.message.reply_text(
             "👋 Добро пожаловать! Давай настроим твой профиль для точного расчета нормы калорий.\n\n"
             "Сколько ты сейчас весишь (в кг)?")
@@ -174,28 +220,24 @@ async def start(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
 async def ask_weight(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     try:
-        print(f"🔍 DEBUG: Processing weight input: {update.message.text}")
         ctx.user_data['weight'] = float(update.message.text.replace(',', '.'))
-        print(f"✅ Weight saved in context: {ctx.user_data['weight']}")
         await update.message.reply_text("Отлично! А какой у тебя рост (в см)?")
         return ASK_HEIGHT
     except ValueError as e:
-        print(f"❌ Error processing weight: {e}")
+        log.debug("Invalid weight input: %s", e)
         await update.message.reply_text("⚠️ Введи число, напр.: 85")
         return ASK_WEIGHT
 
 async def ask_height(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     try:
-        print(f"🔍 DEBUG: Processing height input: {update.message.text}")
         ctx.user_data['height'] = int(update.message.text.strip())
-        print(f"✅ Height saved in context: {ctx.user_data['height']}")
         await update.message.reply_text(
             "Теперь выбери свой пол:",
             reply_markup=gender_markup
         )
         return ASK_GENDER
     except ValueError as e:
-        print(f"❌ Error processing height: {e}")
+        log.debug("Invalid height input: %s", e)
         await update.message.reply_text("⚠️ Введи число, напр.: 180")
         return ASK_HEIGHT
 
@@ -212,7 +254,7 @@ async def ask_gender(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     
     # Получаем URL картинки из Supabase Storage
     image_name = "male-bodyfat.jpg" if ctx.user_data['gender'] == 'male' else "female-bodyfat.jpg"
-    image_url = get_image_url(image_name)
+    image_url = await get_image_url(image_name)
     
     if image_url:
         try:
@@ -222,7 +264,7 @@ async def ask_gender(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                        "Просто напиши число, например: 15"
             )
         except Exception as e:
-            print(f"❌ Failed to send image: {e}")
+            log.warning("❌ Failed to send image: %s", e)
             await update.message.reply_text(
                 "Напиши свой примерный процент жира (число от 3 до 50).\n"
                 "Например: 15"
@@ -280,7 +322,7 @@ async def ask_deficit_mode(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     try:
         # Сохраняем все данные пользователя
-        if not save_user_data(
+        if not await save_user_data(
             uid, 
             ctx.user_data['weight'],
             ctx.user_data['height'],
@@ -303,8 +345,8 @@ async def ask_deficit_mode(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         )
         return CONFIRM_HELP
         
-    except Exception as e:
-        print(f"❌ Error in ask_deficit_mode: {e}")
+    except Exception:
+        log.exception("❌ Error in ask_deficit_mode")
         await update.message.reply_text(
             "⚠️ Произошла ошибка. Пожалуйста, попробуйте еще раз:",
             reply_markup=deficit_markup
@@ -312,40 +354,155 @@ async def ask_deficit_mode(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         return ASK_DEFICIT_MODE
 
 # ─────────────────── Фото еды  ─────────────────────────
+@timed("telegram")
+async def download_photo(ctx: ContextTypes.DEFAULT_TYPE, photo_sizes) -> io.BytesIO:
+    """Скачивает самый маленький подходящий вариант фото в память"""
+    photo = pick_photo_size(photo_sizes)
+    telegram_file: TelegramFile = await ctx.bot.get_file(photo.file_id)
+    buf = io.BytesIO()
+    await telegram_file.download_to_memory(buf)
+    buf.seek(0)
+    return buf
+
+async def detect_ingredients_cached(photo: io.BytesIO, user_id: int) -> str:
+    """Распознаёт продукты на фото, повторные и почти одинаковые фото пользователя берёт из кэша"""
+    # Декодирование, хэш и пережатие — вне event loop
+    try:
+        jpeg, image_hash = await asyncio.to_thread(prepare_photo, photo)
+    except PHOTO_DECODE_ERRORS as e:
+        # Пустой результат — handle_photo посчитает по подписи, если она есть
+        log.warning("⚠️ Could not decode photo from %s: %s", user_id, e)
+        return ""
+
+    cached = photo_cache.get(user_id, image_hash)
+    if cached:
+        log.debug("📷 Photo cache hit (hash %016x)", image_hash)
+        return cached
+
+    ingredients = await detect_food_items_from_image(to_data_url(jpeg))
+    if ingredients:
+        photo_cache.put(user_id, image_hash, ingredients)
+    return ingredients
+
+async def analyze_photo_cached(photo: io.BytesIO, user_id: int, caption: str, on_item=None) -> dict:
+    """КБЖУ по фото одним запросом; результат для фото без подписи кэшируется по хэшу"""
+    try:
+        jpeg, image_hash = await asyncio.to_thread(prepare_photo, photo)
+    except PHOTO_DECODE_ERRORS as e:
+        log.warning("⚠️ Could not decode photo from %s: %s", user_id, e)
+        return {}
+
+    cached = None if caption else photo_analysis_cache.get(user_id, image_hash)
+    if cached:
+        log.debug("📷 Photo cache hit (hash %016x)", image_hash)
+        return cached
+
+    result = await analyze_food_image(to_data_url(jpeg), caption, on_item=on_item)
+    if result and not caption:
+        photo_analysis_cache.put(user_id, image_hash, result)
+    return result
+
+def format_breakdown_item(item: dict) -> str:
+    return (
+        f"- {item['item']}: {round(item['calories'])} ккал, Б: {round(item['protein'], 1)}г, "
+        f"Ж: {round(item['fat'], 1)}г, У: {round(item['carbs'], 1)}г"
+    )
+
+class ProgressiveReply:
+    """
+    Сообщение-заглушка, которое постепенно превращается в ответ:
+    • заглушка отправляется сразу и параллельно с остальной работой
+    • add_item() дописывает позицию разбора; правки идут не чаще
+      PROGRESS_EDIT_INTERVAL, промежуточные состояния схлопываются
+    • finish() дожидается отправленной правки и пишет итоговый текст
+      (если заглушку поправить не удалось — отправляет новое сообщение)
+    """
+
+    def __init__(self, message, text: str):
+        self.message = message
+        self.placeholder = asyncio.create_task(message.reply_text(text))
+        self.lines: list[str] = []
+        self._dirty = asyncio.Event()
+        self._updater: asyncio.Task | None = None
+        self._edit: asyncio.Task | None = None
+
+    def add_item(self, item: dict) -> None:
+        try:
+            self.lines.append(format_breakdown_item(item))
+        except (KeyError, TypeError, ValueError):
+            return
+        self._dirty.set()
+        if self._updater is None:
+            self._updater = asyncio.create_task(self._update())
+
+    async def _update(self) -> None:
+        placeholder = await self.placeholder
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            text = "🍽️ *Разбор еды:*\n" + "\n".join(self.lines) + "\n\n_⏳ Считаю итог..._"
+            self._edit = asyncio.create_task(placeholder.edit_text(text, parse_mode="Markdown"))
+            await asyncio.shield(self._edit)
+            await asyncio.sleep(PROGRESS_EDIT_INTERVAL)
+
+    async def finish(self, text: str, **kwargs):
+        if self._updater is not None:
+            self._updater.cancel()
+            # Промежуточная правка, уже ушедшая в Telegram, не должна перезаписать итог
+            for task in (self._updater, self._edit):
+                if task is not None:
+                    with suppress(asyncio.CancelledError, Exception):
+                        await task
+        try:
+            placeholder = await self.placeholder
+            return await placeholder.edit_text(text, **kwargs)
+        except TelegramError:
+            return await self.message.reply_text(text, **kwargs)
+
 async def handle_photo(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     caption = update.message.caption or ""
-    await update.message.reply_text("🧠 Пытаюсь распознать по фото...")
+    # Заглушка отправляется параллельно со скачиванием и распознаванием,
+    # позиции разбора появляются в ней по мере ответа модели
+    reply = ProgressiveReply(update.message, "🧠 Пытаюсь распознать по фото...")
 
     try:
-        # Скачиваем фото
-        photo = update.message.photo[-1]
-        telegram_file: TelegramFile = await ctx.bot.get_file(photo.file_id)
-        image_bytes = await telegram_file.download_as_bytearray()
-
         if is_detailed_description(caption):
-            result = analyze_food(caption)
+            # Описание достаточно подробное — фото не скачиваем
+            ingredients = caption
+            result = await analyze_food(caption, on_item=reply.add_item)
             comment = "📋 Калории рассчитаны по описанию блюда."
         else:
-            ingredients = await detect_food_items_from_image(image_bytes)
-
-            if ingredients and is_detailed_description(ingredients):
-                print("📷 [analyze_food after image] INPUT:", ingredients)
-                result = analyze_food(ingredients)
+            photo = await download_photo(ctx, update.message.photo)
+            # Распознавание + расчёт целиком, чтобы сравнивать режимы по метрике photo/<режим>
+            with observe("photo", PHOTO_ANALYSIS_MODE):
+                if PHOTO_ANALYSIS_MODE == "one_shot":
+                    result = await analyze_photo_cached(photo, user_id, caption.strip(), on_item=reply.add_item)
+                    ingredients = ", ".join(item["item"] for item in result.get("breakdown", []))
+                else:
+                    ingredients = await detect_ingredients_cached(photo, user_id)
+                    result = {}
+                    if ingredients and is_detailed_description(ingredients):
+                        log.debug("📷 Ingredients from photo: %s", ingredients)
+                        result = await analyze_food(ingredients, on_item=reply.add_item)
+
+            if result:
                 comment = "📷 Калории рассчитаны по фото, могут быть неточности."
             elif caption.strip():
-                result = analyze_food(caption)
+                result = await analyze_food(caption, on_item=reply.add_item)
                 comment = "⚠️ Фото не удалось распознать. Калории рассчитаны по описанию."
             else:
-                await update.message.reply_text("❌ Не удалось распознать блюдо. Добавь описание вручную.")
+                await reply.finish("❌ Не удалось распознать блюдо. Добавь описание вручную.")
                 return
 
+        if not result:
+            # Модель так и не вернула корректный разбор (см. analyze_food)
+            await reply.finish("❌ Не удалось рассчитать КБЖУ. Попробуй описать блюдо подробнее.")
+            return
+
         total = result["total"]
         breakdown = result["breakdown"]
-        breakdown_text = "\n".join(
-            f"- {item['item']}: {round(item['calories'])} ккал, Б: {round(item['protein'], 1)}г, Ж: {round(item['fat'], 1)}г, У: {round(item['carbs'], 1)}г"
-            for item in breakdown
-        )
+        breakdown_text = "\n".join(format_breakdown_item(item) for item in breakdown)
 
         reply_text = (
             f"🍽️ *Разбор еды:*\n"
@@ -354,37 +511,39 @@ async def handle_photo(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             f"Б: {round(total['protein'], 1)}г | Ж: {round(total['fat'], 1)}г | У: {round(total['carbs'], 1)}г\n\n"
             f"_{comment}_"
         )
-        await update.message.reply_text(reply_text, parse_mode="Markdown")
+        await reply.finish(reply_text, parse_mode="Markdown")
 
-        # Сохраняем прием пищи
-        save_meal(
+        # Пользователь уже видит результат — сохранение идёт в фоне
+        # (ошибка попадёт в error_handler вместе с апдейтом)
+        ctx.application.create_task(save_meal(
             user_id,
             caption or "[Фото]",
             round(total["calories"]),
             round(total["protein"], 1),
             round(total["fat"], 1),
             round(total["carbs"], 1)
-        )
+        ), update=update)
 
         # НОВОЕ: Предлагаем сохранить в избранное
         ctx.user_data['last_meal'] = {
             'name': caption or "[Фото]",
-            'description': caption if is_detailed_description(caption) else ingredients,
+            'description': ingredients,
             'calories': round(total["calories"]),
             'protein': round(total["protein"], 1),
             'fat': round(total["fat"], 1),
             'carbs': round(total["carbs"], 1)
         }
         
+        # Клавиатуру ответа нельзя добавить правкой сообщения, поэтому вопрос — отдельным сообщением
         await update.message.reply_text(
             "💾 Хотите сохранить это блюдо в избранное для быстрого добавления в будущем?",
             reply_markup=save_favorite_markup
         )
         return SAVE_FAVORITE_MENU
 
-    except Exception as e:
-        print("❌ Ошибка при разборе фото:", e)
-        await update.message.reply_text("Произошла ошибка. Попробуйте ещё раз.")
+    except Exception:
+        log.exception("❌ Ошибка при разборе фото")
+        await reply.finish("Произошла ошибка. Попробуйте ещё раз.")
 
 async def handle_save_favorite_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает решение о сохранении в избранное"""
@@ -417,7 +576,7 @@ async def handle_save_favorite_menu(update: Update, ctx: ContextTypes.DEFAULT_TY
         last_meal = ctx.user_data['last_meal']
         user_id = update.effective_user.id
         
-        success = save_favorite_meal(
+        success = await save_favorite_meal(
             user_id,
             meal_name,
             last_meal['description'],
@@ -448,7 +607,7 @@ async def handle_save_favorite_menu(update: Update, ctx: ContextTypes.DEFAULT_TY
 async def show_favorite_meals(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Показывает список любимых блюд"""
     user_id = update.effective_user.id
-    favorites = get_favorite_meals(user_id)
+    favorites = await get_favorite_meals(user_id)
     
     if not favorites:
         await update.message.reply_text(
@@ -499,14 +658,14 @@ async def handle_favorite_meals_menu(update: Update, ctx: ContextTypes.DEFAULT_T
     # Используем любимое блюдо
     user_id = update.effective_user.id
     favorite_id = favorites_dict[txt]
-    meal_data = use_favorite_meal(user_id, favorite_id)
+    meal_data = await use_favorite_meal(user_id, favorite_id)
     
     if not meal_data:
         await update.message.reply_text("❌ Ошибка при добавлении блюда.", reply_markup=markup)
         return ConversationHandler.END
     
     # Сохраняем в дневник
-    save_meal(
+    await save_meal(
         user_id,
         meal_data['name'],
         meal_data['calories'],
@@ -549,47 +708,45 @@ async def handle_charts_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Выберите действие:", reply_markup=markup)
         return ConversationHandler.END
     
+    if txt not in CHARTS:
+        await update.message.reply_text("⚠️ Неизвестный тип графика", reply_markup=charts_markup)
+        return CHARTS_MENU
+    
+    kind, days, create_chart, chart_title = CHARTS[txt]
+    cache_key = chart_cache_key(user_id, kind, days)
+    
+    # Данные не менялись — отправляем уже загруженный в Telegram график
+    cached_chart = get_cached_chart(cache_key)
+    if cached_chart:
+        try:
+            await update.message.reply_photo(
+                photo=cached_chart,
+                caption=chart_title,
+                reply_markup=charts_markup
+            )
+            return CHARTS_MENU
+        except BadRequest as e:
+            # file_id устарел (например, сменился токен бота) — рисуем заново
+            log.warning("⚠️ Cached chart %s rejected by Telegram (%s), re-rendering", kind, e)
+            forget_chart(cache_key)
+    
     # Показываем индикатор загрузки
     loading_msg = await update.message.reply_text("📊 Генерирую график, подождите...")
     
-    chart_file = None
-    chart_title = ""
-    
     try:
-        if txt == "📉 График веса":
-            chart_file = create_weight_chart(user_id, days=30)
-            chart_title = "📉 Динамика веса за 30 дней"
-            
-        elif txt == "🔥 График калорий":
-            chart_file = create_calories_chart(user_id, days=7)  
-            chart_title = "🔥 Калории за 7 дней"
-            
-        elif txt == "🥗 Баланс БЖУ":
-            chart_file = create_macros_chart(user_id, days=7)
-            chart_title = "🥗 Баланс БЖУ за 7 дней"
-            
-        elif txt == "👣 Активность":
-            chart_file = create_activity_chart(user_id, days=7)
-            chart_title = "👣 Активность за 7 дней"
-            
-        else:
-            await loading_msg.edit_text("⚠️ Неизвестный тип графика")
-            return CHARTS_MENU
+        chart_png = await create_chart(user_id, days=days)
             
         # Удаляем сообщение о загрузке
         await loading_msg.delete()
         
-        if chart_file and os.path.exists(chart_file):
-            # Отправляем график
-            with open(chart_file, 'rb') as photo:
-                await update.message.reply_photo(
-                    photo=photo,
-                    caption=chart_title,
-                    reply_markup=charts_markup
-                )
-            
-            # Очищаем временный файл
-            cleanup_temp_files(user_id)
+        if chart_png:
+            # Отправляем график прямо из памяти
+            sent = await update.message.reply_photo(
+                photo=chart_png,
+                caption=chart_title,
+                reply_markup=charts_markup
+            )
+            remember_chart(cache_key, sent.photo[-1].file_id if sent.photo else chart_png)
             
         else:
             await update.message.reply_text(
@@ -600,8 +757,8 @@ async def handle_charts_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             
         return CHARTS_MENU
         
-    except Exception as e:
-        print(f"❌ Error creating chart: {e}")
+    except Exception:
+        log.exception("❌ Error creating chart")
         await loading_msg.edit_text(
             "❌ Произошла ошибка при создании графика. Попробуйте позже.",
             reply_markup=charts_markup
@@ -679,10 +836,10 @@ async def input_weight_today(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         
         # Получаем вчерашний вес
         yesterday = date.today() - timedelta(days=1)
-        old_weight = get_last_weight(uid, exclude_date=date.today())
+        old_weight = await get_last_weight(uid, exclude_date=date.today())
         
         # Сохраняем новый вес
-        save_weight(uid, new_weight, date=date.today())
+        await save_weight(uid, new_weight, date=date.today())
         
         # Формируем сообщение с правильным эмодзи
         emoji = "⚖️" if not old_weight else get_weight_trend_emoji(old_weight, new_weight)
@@ -708,10 +865,10 @@ async def input_weight_yesterday(update: Update, ctx: ContextTypes.DEFAULT_TYPE)
         
         # Получаем предыдущий вес (за позавчера)
         day_before = yesterday - timedelta(days=1)
-        old_weight = get_last_weight(uid, exclude_date=yesterday)
+        old_weight = await get_last_weight(uid, exclude_date=yesterday)
         
         # Сохраняем новый вес
-        save_weight(uid, new_weight, date=yesterday)
+        await save_weight(uid, new_weight, date=yesterday)
         
         # Формируем сообщение с правильным эмодзи
         emoji = "⚖️" if not old_weight else get_weight_trend_emoji(old_weight, new_weight)
@@ -732,7 +889,7 @@ async def input_weight_yesterday(update: Update, ctx: ContextTypes.DEFAULT_TYPE)
 async def input_steps_today(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     try:
         steps = int(update.message.text.strip())
-        save_steps(update.effective_user.id, steps, date=date.today())
+        await save_steps(update.effective_user.id, steps, date=date.today())
         await update.message.reply_text(f"👍 Шаги за сегодня сохранены: {steps}.", reply_markup=markup)
         return ConversationHandler.END
     except ValueError:
@@ -743,7 +900,7 @@ async def input_steps_yesterday(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     try:
         steps = int(update.message.text.strip())
         d = date.today() - timedelta(days=1)
-        save_steps(update.effective_user.id, steps, date=d)
+        await save_steps(update.effective_user.id, steps, date=d)
         await update.message.reply_text(f"👍 Шаги за вчера сохранены: {steps}.", reply_markup=markup)
         await send_summary(update.effective_user.id, update, target_date=d)
         return ConversationHandler.END
@@ -756,7 +913,7 @@ async def input_burn(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         burned = int(update.message.text.strip())
         uid = update.effective_user.id
         # Сохраняем сожженные калории
-        save_burned_calories(uid, burned, date=date.today())
+        await save_burned_calories(uid, burned, date=date.today())
         await update.message.reply_text(
             f"🔥 Учтено {burned} ккал дополнительной активности",
             reply_markup=markup
@@ -778,10 +935,10 @@ async def handle_track(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             new_weight = float(re.sub(r'[^0-9.,]', '', txt.split('вес',1)[1]))
             
             # Получаем предыдущий вес
-            old_weight = get_last_weight(uid, exclude_date=d)
+            old_weight = await get_last_weight(uid, exclude_date=d)
             
             # Сохраняем новый вес
-            save_weight(uid, new_weight, date=d)
+            await save_weight(uid, new_weight, date=d)
             
             # Формируем сообщение с правильным эмодзи
             emoji = "⚖️" if not old_weight else get_weight_trend_emoji(old_weight, new_weight)
@@ -800,7 +957,7 @@ async def handle_track(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     elif 'шаги' in txt:
         try:
             steps = int(re.sub(r'[^0-9]', '', txt.split('шаги',1)[1]))
-            save_steps(uid, steps, date=d)
+            await save_steps(uid, steps, date=d)
             await update.message.reply_text(f"👍 Шаги за {'вчера' if is_yest else 'сегодня'} сохранены: {steps}.")
             if is_yest:
                 await send_summary(uid, update, target_date=d)
@@ -813,7 +970,7 @@ async def show_delete_menu(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     today = date.today()
     
-    meals = get_meals_for_date(uid, today)
+    meals = await get_meals_for_date(uid, today)
     
     if not meals:
         await update.message.reply_text(
@@ -877,7 +1034,7 @@ async def handle_delete_selection(update: Update, ctx: ContextTypes.DEFAULT_TYPE
     
     # Получаем информацию о блюде для подтверждения
     meal_id = meals_dict[meal_number]
-    meal_info = get_meal_by_id(meal_id)
+    meal_info = await get_meal_by_id(meal_id)
     
     if not meal_info:
         await update.message.reply_text("❌ Прием пищи не найден.", reply_markup=markup)
@@ -913,7 +1070,7 @@ async def handle_delete_confirm(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if txt == "✅ Да, удалить":
         meal_id = ctx.user_data.get('meal_to_delete_id')
         
-        if meal_id and delete_meal(meal_id):
+        if meal_id and await delete_meal(meal_id):
             await update.message.reply_text(
                 "✅ Прием пищи успешно удален!\n"
                 "Обновленная сводка:",
@@ -1012,33 +1169,28 @@ async def send_summary(uid: int, target, *, target_date: date|None=None):
     target_date = target_date or date.today()
     
     try:
-        nutr = get_nutrition_for_date(uid, target_date)
-        goals = get_user_targets(uid)
-        prof = get_user_profile(uid)
-        steps = get_steps_for_date(uid, target_date) or 0
+        # Независимые запросы к Supabase выполняем параллельно
+        nutr, goals, prof, steps, extra_burned = await asyncio.gather(
+            get_nutrition_for_date(uid, target_date),
+            get_user_targets(uid),
+            get_user_profile(uid),
+            get_steps_for_date(uid, target_date),
+            get_burned_calories(uid, target_date)  # Дополнительно сожженные калории
+        )
+        steps = steps or 0
         weight = prof['weight'] if prof else 70
         
-        print(f"🔍 DEBUG: Profile data:")
-        print(f"Weight: {weight}kg")
-        print(f"Body fat: {prof['bodyfat']}%")
-        print(f"Goals: {goals}")
-        
         # Получаем все сожженные калории
         steps_burned = round(steps * weight * 0.00035)  # Калории от шагов
-        extra_burned = get_burned_calories(uid, target_date)  # Дополнительно сожженные калории
         total_burned = steps_burned + extra_burned
         
-        print(f"🔥 DEBUG: Calories burned:")
-        print(f"Steps: {steps} -> {steps_burned} kcal")
-        print(f"Extra: {extra_burned} kcal")
-        print(f"Total burned: {total_burned} kcal")
-        
         eat_kcal = nutr['calories'] if nutr else 0
         daily_target = goals['calories'] + total_burned if goals else total_burned
         
-        print(f"📊 DEBUG: Daily targets:")
-        print(f"Base calories: {goals['calories']} kcal")
-        print(f"With activity: {daily_target} kcal")
+        log.debug(
+            "Summary for %s on %s: weight=%s goals=%s steps=%s (%s kcal) extra=%s kcal target=%s kcal",
+            uid, target_date, weight, goals, steps, steps_burned, extra_burned, daily_target
+        )
         
         # Формируем сообщение
         txt = f"📊 *Итоги за {target_date:%d.%m}:*\n"
@@ -1072,6 +1224,7 @@ async def send_summary(uid: int, target, *, target_date: date|None=None):
             await target.send_message(chat_id=uid, text=txt, parse_mode='Markdown')
             
     except Exception as e:
+        log.exception("❌ Failed to build summary for %s", uid)
         error_txt = f"⚠️ Ошибка при формировании отчета: {str(e)}"
         if isinstance(target, Update):
             await target.message.reply_text(error_txt)
@@ -1079,91 +1232,97 @@ async def send_summary(uid: int, target, *, target_date: date|None=None):
             await target.send_message(chat_id=uid, text=error_txt)
 
 # ───────────────── Планировщик задач ────────────────────
-async def send_steps_reminder(ctx: ContextTypes.DEFAULT_TYPE):
+# Вместо пяти run_daily на каждого пользователя регистрируется по одной задаче
+# на каждый временной слот. В момент срабатывания задача берёт множество
+# подписанных пользователей и обрабатывает их параллельно с ограничением.
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+# Растянуть рассылку слота на N секунд (0 — всем сразу, темп задаёт лимитер отправки)
+BROADCAST_SPREAD_SECONDS = float(os.getenv("BROADCAST_SPREAD_SECONDS", "0"))
+
+# Пользователи, которым рассылаются напоминания и итоги
+scheduled_users: set[int] = set()
+
+async def send_steps_reminder(bot, uid: int):
     """Напоминание о шагах за вчера (09:00)"""
-    job = ctx.job
-    uid = int(job.data)
     yesterday = date.today() - timedelta(days=1)
-    if not steps_exist_for_date(uid, yesterday):
-        await ctx.bot.send_message(
+    if not await steps_exist_for_date(uid, yesterday):
+        await bot.send_message(
             chat_id=uid,
             text=random.choice(STEPS_REMINDER_YESTERDAY)
         )
 
-async def send_morning_meal_reminder(ctx: ContextTypes.DEFAULT_TYPE):
+async def send_morning_meal_reminder(bot, uid: int):
     """Напоминание о завтраке (11:00)"""
-    job = ctx.job
-    uid = int(job.data)
-    if not has_meals_in_timerange(uid, date.today(), 0, 10):
-        await ctx.bot.send_message(
+    if not await has_meals_in_timerange(uid, date.today(), 0, 10):
+        await bot.send_message(
             chat_id=uid,
             text=random.choice(MEAL_REMINDER_MORNING)
         )
 
-async def send_afternoon_meal_reminder(ctx: ContextTypes.DEFAULT_TYPE):
+async def send_afternoon_meal_reminder(bot, uid: int):
     """Напоминание об обеде (16:00)"""
-    job = ctx.job
-    uid = int(job.data)
-    if not has_meals_in_timerange(uid, date.today(), 11, 15):
-        await ctx.bot.send_message(
+    if not await has_meals_in_timerange(uid, date.today(), 11, 15):
+        await bot.send_message(
             chat_id=uid,
             text=random.choice(MEAL_REMINDER_AFTERNOON)
         )
 
-async def send_evening_meal_reminder(ctx: ContextTypes.DEFAULT_TYPE):
-    """Напоминание об ужине (23:00)"""
-    job = ctx.job
-    uid = int(job.data)
-    if not has_meals_in_timerange(uid, date.today(), 16, 22):
-        await ctx.bot.send_message(
+async def send_evening_meal_reminder(bot, uid: int):
+    """Напоминание об ужине (22:00)"""
+    if not await has_meals_in_timerange(uid, date.today(), 16, 22):
+        await bot.send_message(
             chat_id=uid,
             text=random.choice(MEAL_REMINDER_EVENING)
         )
 
-async def send_daily_summary(ctx: ContextTypes.DEFAULT_TYPE):
+async def send_daily_summary(bot, uid: int):
     """Обертка для отправки ежедневного отчета"""
-    job = ctx.job
-    uid = int(job.data)
-    await send_summary(uid, ctx.bot)
+    await send_summary(uid, bot)
+
+# (имя слота, время, обработчик одного пользователя)
+DAILY_SLOTS = [
+    ("steps_reminder", time(9, 0, tzinfo=ZONE), send_steps_reminder),
+    ("morning_meal", time(11, 0, tzinfo=ZONE), send_morning_meal_reminder),
+    ("afternoon_meal", time(16, 0, tzinfo=ZONE), send_afternoon_meal_reminder),
+    ("evening_meal", time(22, 0, tzinfo=ZONE), send_evening_meal_reminder),
+    ("summary", time(22, 30, tzinfo=ZONE), send_daily_summary),
+]
 
-from datetime import time
+async def run_slot(ctx: ContextTypes.DEFAULT_TYPE):
+    """Рассылает задачу слота всем подписанным пользователям"""
+    per_user = ctx.job.data
+    users = list(scheduled_users)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    step = BROADCAST_SPREAD_SECONDS / len(users) if users else 0
+
+    async def run_for(index: int, uid: int):
+        if step:
+            await asyncio.sleep(index * step)
+        async with semaphore:
+            try:
+                await per_user(ctx.bot, uid)
+            except Exception as e:
+                log.warning("❌ Slot %s failed for user %s: %s", ctx.job.name, uid, e)
+
+    # Отправки рассылки уступают очередь ответам пользователям
+    with broadcast_priority():
+        await asyncio.gather(*(run_for(i, uid) for i, uid in enumerate(users)))
+    log.info("✅ Slot %s processed for %d users", ctx.job.name, len(users))
+
+async def warm_up_charts_job(ctx: ContextTypes.DEFAULT_TYPE):
+    """Прогрев графиков, когда бот уже обрабатывает апдейты"""
+    await warm_up_charts()
+
+def register_daily_slots(job_queue):
+    """Регистрирует по одной ежедневной задаче на каждый слот"""
+    for name, slot_time, per_user in DAILY_SLOTS:
+        job_queue.run_daily(
+            instrument_callback(f"job:{name}", run_slot), time=slot_time, data=per_user, name=name
+        )
 
-def schedule_for_user(job_queue, user_id: int):
-    
-    job_queue.run_daily(
-        send_steps_reminder,
-        time=time(9, 0, tzinfo=ZONE),
-        data=user_id,
-        name=f"steps_reminder_{user_id}"
-    )
-    
-    job_queue.run_daily(
-        send_morning_meal_reminder,
-        time=time(11, 0, tzinfo=ZONE),
-        data=user_id,
-        name=f"morning_meal_{user_id}"
-    )
-    
-    job_queue.run_daily(
-        send_afternoon_meal_reminder,
-        time=time(16, 0, tzinfo=ZONE),
-        data=user_id,
-        name=f"afternoon_meal_{user_id}"
-    )
-    
-    job_queue.run_daily(
-        send_evening_meal_reminder,
-        time=time(22, 0, tzinfo=ZONE),
-        data=user_id,
-        name=f"evening_meal_{user_id}"
-    )
-    
-    job_queue.run_daily(
-        send_daily_summary,
-        time=time(22, 30, tzinfo=ZONE),
-        data=user_id,
-        name=f"summary_{user_id}"
-    )
+def schedule_for_user(user_id: int):
+    """Подписывает пользователя на напоминания и ежедневные итоги"""
+    scheduled_users.add(user_id)
 
 # ───────────────── Помощь и обновление клавиатуры ────────────────
 async def update_keyboard(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
@@ -1184,9 +1343,8 @@ async def confirm_help(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
             return CONFIRM_HELP
         
         # Отправляем пример с фото еды
-        image_url = get_image_url("buckwheat.jpg")
-        print(f"🔍 DEBUG: Got image URL for buckwheat.jpg: {image_url}")
-        
+        image_url = await get_image_url("buckwheat.jpg")
+
         await update.message.reply_text(
             "👨‍🍳 Вот пример того, как нужно отправлять фото еды:",
             reply_markup=markup
@@ -1199,7 +1357,7 @@ async def confirm_help(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
                     caption="гречка 80г, курица 200г, морковь 50г, зелень"
                 )
             except Exception as e:
-                print(f"❌ Failed to send example image: {e}")
+                log.warning("❌ Failed to send example image: %s", e)
                 # Continue even if image sending fails
         
         await update.message.reply_text(
@@ -1210,16 +1368,16 @@ async def confirm_help(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         # Schedule reminders for the new user
         uid = update.effective_user.id
         try:
-            schedule_for_user(ctx.application.job_queue, uid)
-            print(f"✅ Scheduled reminders for user {uid}")
+            schedule_for_user(uid)
+            log.info("✅ Scheduled reminders for user %s", uid)
         except Exception as e:
-            print(f"❌ Failed to schedule reminders for user {uid}: {e}")
+            log.error("❌ Failed to schedule reminders for user %s: %s", uid, e)
             # Continue even if scheduling fails
         
         return ConversationHandler.END
         
-    except Exception as e:
-        print(f"❌ Error in confirm_help: {e}")
+    except Exception:
+        log.exception("❌ Error in confirm_help")
         await update.message.reply_text(
             "⚠️ Произошла ошибка. Пожалуйста, попробуйте еще раз:",
             reply_markup=confirm_markup
@@ -1258,20 +1416,18 @@ async def change_deficit_mode(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
     
     # Получаем текущий профиль для сравнения
-    old_profile = get_user_profile(uid)
-    print(f"🔄 DEBUG: Changing deficit mode for user {uid}")
-    print(f"Old profile: {old_profile}")
+    old_profile = await get_user_profile(uid)
+    log.debug("Changing deficit mode for user %s, old profile: %s", uid, old_profile)
     
     # Устанавливаем новый режим
-    set_deficit_mode(uid, text)
+    await set_deficit_mode(uid, text)
     
     # Получаем обновленный профиль
-    new_profile = get_user_profile(uid)
-    print(f"New profile: {new_profile}")
+    new_profile = await get_user_profile(uid)
     
     # Получаем новые цели
-    new_targets = get_user_targets(uid)
-    print(f"New targets: {new_targets}")
+    new_targets = await get_user_targets(uid)
+    log.debug("New profile: %s, targets: %s", new_profile, new_targets)
     
     await update.message.reply_text(
         f"✅ Режим изменён на «{text}»\n"
@@ -1281,31 +1437,98 @@ async def change_deficit_mode(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+# ───────────────── Запуск ────────────────────────────────
+# При импорте сеть не используется: проверка Supabase, хранилища и загрузка
+# пользователей идут параллельно сразу после старта приложения.
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "1000"))
+USERS_RELOAD_DELAY = 60
+
+first_update_handled = False
+
+async def load_scheduled_users() -> int:
+    """Подписывает на рассылки всех пользователей из БД, страницами по USERS_PAGE_SIZE"""
+    after, total = None, 0
+    while True:
+        page = await get_user_ids_page(after, USERS_PAGE_SIZE)
+        scheduled_users.update(int(uid) for uid in page)
+        total += len(page)
+        if len(page) < USERS_PAGE_SIZE:
+            return total
+        after = page[-1]
+
+async def load_scheduled_users_job(ctx: ContextTypes.DEFAULT_TYPE):
+    """Загрузка пользователей с повтором, если БД была недоступна"""
+    try:
+        total = await load_scheduled_users()
+        log.info("✅ Scheduled %d users", total)
+    except Exception:
+        log.exception("❌ Failed to load users, retrying in %ds", USERS_RELOAD_DELAY)
+        ctx.job_queue.run_once(load_scheduled_users_job, USERS_RELOAD_DELAY, name="load_users")
+
+async def run_startup_tasks(ctx: ContextTypes.DEFAULT_TYPE):
+    """Проверки и загрузка данных после старта — параллельно и не задерживая приём апдейтов"""
+    STARTUP_SECONDS.labels("ready").set(monotonic() - STARTED_AT)
+    start = monotonic()
+    results = await asyncio.gather(
+        check_connection(), init_storage(), load_scheduled_users_job(ctx),
+        return_exceptions=True
+    )
+    for name, result in zip(("check_connection", "init_storage"), results):
+        if isinstance(result, Exception):
+            log.error("❌ Startup task %s failed", name, exc_info=result)
+    STARTUP_SECONDS.labels("startup_tasks").set(monotonic() - start)
+    log.info("🚀 Startup tasks finished in %.2fs (%.2fs since process start)",
+             monotonic() - start, monotonic() - STARTED_AT)
+
+async def record_first_update(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Время от старта процесса до первого обработанного апдейта"""
+    global first_update_handled
+    if first_update_handled:
+        return
+    first_update_handled = True
+    elapsed = monotonic() - STARTED_AT
+    STARTUP_SECONDS.labels("first_update").set(elapsed)
+    log.info("⏱️ First update handled %.2fs after process start", elapsed)
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик ошибок для бота."""
-    print(f"⚠️ Exception while handling an update: {context.error}")
+    log.error("⚠️ Exception while handling an update", exc_info=context.error)
     try:
         if update and update.effective_message:
             await update.effective_message.reply_text(
                 "Извините, произошла ошибка. Попробуйте еще раз или обратитесь к администратору."
             )
     except Exception as e:
-        print(f"❌ Failed to send error message: {e}")
+        log.error("❌ Failed to send error message: %s", e)
 
 # ───────────────── Main ────────────────────────────────
 # Замените секцию if __name__ == '__main__': на эту:
 
 if __name__ == '__main__':
-    # Инициализируем хранилище
-    init_storage()
-    
-    app = ApplicationBuilder().token(TOKEN).build()
+    setup_logging()
+
+    persistence_options = dict(
+        store_data=PersistenceInput(bot_data=False, callback_data=False),
+        update_interval=PERSISTENCE_INTERVAL
+    )
+    if PERSISTENCE_PATH:
+        log.info("💾 Bot state is stored in SQLite at %s", PERSISTENCE_PATH)
+        persistence = SQLitePersistence(PERSISTENCE_PATH, **persistence_options)
+    else:
+        persistence = SupabasePersistence(supabase_admin, **persistence_options)
+    builder = ApplicationBuilder().token(TOKEN).persistence(persistence).rate_limiter(TelegramRateLimiter())
+    if BOT_MODE == "webhook":
+        # Апдейты приходят в HTTP-сервер, очередь ограничена
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+    app = builder.build()
 
     # Добавляем обработчик ошибок
     app.add_error_handler(error_handler)
 
     # Обработчик первого запуска и анкеты
     start_conv = ConversationHandler(
+        name="start_conv",
+        persistent=True,
         entry_points=[CommandHandler('start', start)],
         states={
             ASK_WEIGHT: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_weight)],
@@ -1322,6 +1545,8 @@ if __name__ == '__main__':
     
     # Обработчик фотографий с возможностью сохранения в избранное
     photo_conv = ConversationHandler(
+        name="photo_conv",
+        persistent=True,
         entry_points=[MessageHandler(filters.PHOTO, handle_photo)],
         states={
             SAVE_FAVORITE_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_save_favorite_menu)],
@@ -1333,6 +1558,8 @@ if __name__ == '__main__':
     
     # Обработчик кнопок и ввода данных
     button_conv = ConversationHandler(
+    name="button_conv",
+    persistent=True,
     entry_points=[MessageHandler(filters.Regex('^(⚖️ Track вес|👣 Track шаги|📊 Summary|🔥 Burn|🍎 Любимые блюда|📈 Графики|🗑️ Удалить еду|❓ Help|⚙️ Режим)$'), handle_button)],
     states={
         WEIGHT_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_weight_menu)],
@@ -1369,46 +1596,21 @@ if __name__ == '__main__':
     # Остальные обработчики
     app.add_handler(MessageHandler(filters.Regex(r'^итоги$'), daily_summary))
     app.add_handler(MessageHandler(filters.Regex(r'^/track'), handle_track))
-
-    # Подписка на всех
-    existing = [int(u['user_id']) for u in supabase.table('users').select('user_id').execute().data]
-    for uid in existing:
-        schedule_for_user(app.job_queue, uid)
-
-    print('🚀 Бот запущен (polling)')
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
-
-    photo_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.PHOTO, handle_photo)],
-    states={
-        SAVE_FAVORITE_MENU: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_save_favorite_menu)],
-    },
-    fallbacks=[
-        CommandHandler('start', start),
-    ]
-)
-
-    # ВАЖНО: Добавляем обработчики в правильном порядке!
-    app.add_handler(start_conv)
-    app.add_handler(button_conv)
-    
-    # Эти обработчики должны быть ПОСЛЕ ConversationHandler
-    app.add_handler(CommandHandler('summary', daily_summary))
-    app.add_handler(CommandHandler('help', send_help))
-    app.add_handler(CommandHandler('keyboard', update_keyboard))
-    
-    # КРИТИЧЕСКИ ВАЖНО: Обработчик фотографий должен быть здесь!
-    app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-    
-    # Остальные обработчики
-    app.add_handler(MessageHandler(filters.Regex(r'^итоги$'), daily_summary))
-    app.add_handler(MessageHandler(filters.Regex(r'^/track'), handle_track))
-
-    # Подписка на всех
-    existing = [int(u['user_id']) for u in supabase.table('users').select('user_id').execute().data]
-    for uid in existing:
-        schedule_for_user(app.job_queue, uid)
-
-    print('🚀 Бот запущен (polling)')
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
-
+    instrument_application(app)
+    # После основных обработчиков (группа 0) — замер времени до первого апдейта
+    app.add_handler(TypeHandler(Update, record_first_update), group=1)
+
+    # Одна задача на слот; пользователи и проверки — сразу после старта
+    register_daily_slots(app.job_queue)
+    app.job_queue.run_once(run_startup_tasks, 0, name="startup")
+    if CHART_WARMUP_DELAY >= 0:
+        app.job_queue.run_once(warm_up_charts_job, CHART_WARMUP_DELAY, name="charts_warmup")
+
+    if BOT_MODE == "webhook":
+        log.info('🚀 Бот запущен (webhook)')
+        start_metrics_server()
+        asyncio.run(run_webhook(app, allowed_updates=Update.ALL_TYPES))
+    else:
+        log.info('🚀 Бот запущен (polling)')
+        start_metrics_server()
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
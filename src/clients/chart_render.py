@@ -0,0 +1,265 @@
+"""
+Отрисовка графиков в PNG 📊
+───────────────────────────
+Чистые функции: получают уже загруженные данные и возвращают PNG в байтах.
+Используется объектный API matplotlib (Figure + Agg) без глобального
+состояния pyplot и без временных файлов, поэтому функции безопасно
+запускать в пуле процессов (см. charts_client).
+
+render / warm_up – то, что charts_client отправляет в пул: при передаче в процесс
+функция сериализуется ссылкой на этот модуль, поэтому процесс отрисовки
+импортирует только его (и preload forkserver'а), а не модули бота.
+"""
+import io
+from typing import Dict, List, Optional
+
+import matplotlib
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from cycler import cycler
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+CHART_DPI = 150
+
+# Настройка стиля графиков
+CHART_STYLE = {
+    "axes.prop_cycle": cycler(color=sns.color_palette("husl")),
+    "figure.figsize": (10, 6),
+    "font.size": 12,
+    "axes.grid": True,
+    "grid.alpha": 0.3,
+}
+
+def _new_figure(**kwargs) -> Figure:
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+def _to_png(fig: Figure) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=CHART_DPI, bbox_inches="tight")
+    return buf.getvalue()
+
+def render_weight_chart(data: List[Dict], days: int) -> Optional[bytes]:
+    """График изменения веса"""
+    if len(data) < 2:
+        return None
+
+    with matplotlib.rc_context(CHART_STYLE):
+        # Создаем DataFrame
+        df = pd.DataFrame(data)
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date')
+
+        # Создаем график
+        fig = _new_figure(figsize=(12, 6))
+        ax = fig.subplots()
+
+        # Основная линия веса
+        ax.plot(df['date'], df['weight'],
+                marker='o', linewidth=2.5, markersize=6,
+                color='#2E86AB', label='Вес')
+
+        # Тренд
+        z = np.polyfit(range(len(df)), df['weight'], 1)
+        p = np.poly1d(z)
+        ax.plot(df['date'], p(range(len(df))),
+                linestyle='--', alpha=0.7, color='#A23B72', label='Тренд')
+
+        # Оформление
+        ax.set_title(f'📉 Динамика веса за {days} дней', fontsize=16, fontweight='bold', pad=20)
+        ax.set_xlabel('Дата', fontsize=12)
+        ax.set_ylabel('Вес (кг)', fontsize=12)
+
+        # Форматирование дат на оси X
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+        ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, days//7)))
+        ax.tick_params(axis='x', labelrotation=45)
+
+        # Сетка и легенда
+        ax.grid(True, alpha=0.3)
+        ax.legend(fontsize=10)
+
+        # Статистика
+        weight_change = df['weight'].iloc[-1] - df['weight'].iloc[0]
+        change_text = f"Изменение: {weight_change:+.1f} кг"
+        ax.text(0.02, 0.98, change_text, transform=ax.transAxes,
+                fontsize=11, verticalalignment='top',
+                bbox=dict(boxstyle='round', facecolor='lightblue', alpha=0.8))
+
+        fig.tight_layout()
+        return _to_png(fig)
+
+def render_calories_chart(data: List[Dict], days: int, target_calories: int) -> Optional[bytes]:
+    """Столбчатый график калорий с линией цели"""
+    if not data:
+        return None
+
+    with matplotlib.rc_context(CHART_STYLE):
+        # Создаем DataFrame
+        df = pd.DataFrame(data)
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date')
+
+        # Создаем график
+        fig = _new_figure(figsize=(12, 6))
+        ax = fig.subplots()
+
+        # Столбчатая диаграмма калорий
+        bars = ax.bar(df['date'], df['calories'],
+                     color=['#FF6B6B' if cal > target_calories else '#4ECDC4'
+                           for cal in df['calories']],
+                     alpha=0.8, edgecolor='white', linewidth=1)
+
+        # Линия цели
+        ax.axhline(y=target_calories, color='#FFD93D', linestyle='--',
+                  linewidth=2, label=f'Цель: {target_calories} ккал')
+
+        # Оформление
+        ax.set_title(f'🔥 Калории за {days} дней', fontsize=16, fontweight='bold', pad=20)
+        ax.set_xlabel('Дата', fontsize=12)
+        ax.set_ylabel('Калории', fontsize=12)
+
+        # Форматирование дат
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+        ax.tick_params(axis='x', labelrotation=45)
+
+        # Подписи на столбцах
+        for bar, cal in zip(bars, df['calories']):
+            if cal > 0:
+                ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 20,
+                       f'{int(cal)}', ha='center', va='bottom', fontsize=9)
+
+        # Статистика
+        avg_calories = df['calories'].mean()
+        stats_text = f"Среднее: {avg_calories:.0f} ккал/день"
+        ax.text(0.02, 0.98, stats_text, transform=ax.transAxes,
+                fontsize=11, verticalalignment='top',
+                bbox=dict(boxstyle='round', facecolor='lightyellow', alpha=0.8))
+
+        ax.grid(True, alpha=0.3)
+        ax.legend(fontsize=10)
+        fig.tight_layout()
+        return _to_png(fig)
+
+def render_macros_chart(data: List[Dict], days: int) -> Optional[bytes]:
+    """Круговая диаграмма БЖУ + столбцы в граммах"""
+    if not data:
+        return None
+
+    # Суммируем БЖУ за период
+    total_protein = sum(d['protein'] for d in data)
+    total_fat = sum(d['fat'] for d in data)
+    total_carbs = sum(d['carbs'] for d in data)
+
+    if total_protein + total_fat + total_carbs == 0:
+        return None
+
+    # Конвертируем в калории
+    protein_cal = total_protein * 4
+    fat_cal = total_fat * 9
+    carbs_cal = total_carbs * 4
+
+    # Данные для диаграммы
+    labels = ['Белки', 'Жиры', 'Углеводы']
+    sizes = [protein_cal, fat_cal, carbs_cal]
+    colors = ['#FF9999', '#66B2FF', '#99FF99']
+
+    with matplotlib.rc_context(CHART_STYLE):
+        # Создаем график
+        fig = _new_figure(figsize=(14, 6))
+        ax1, ax2 = fig.subplots(1, 2)
+
+        # Круговая диаграмма
+        ax1.pie(sizes, labels=labels, colors=colors,
+                autopct='%1.1f%%', startangle=90,
+                textprops={'fontsize': 11})
+
+        ax1.set_title(f'🥗 Баланс БЖУ за {days} дней\n(в калориях)',
+                     fontsize=14, fontweight='bold', pad=20)
+
+        # Столбчатая диаграмма в граммах
+        gram_data = [total_protein, total_fat, total_carbs]
+        bars = ax2.bar(labels, gram_data, color=colors, alpha=0.8)
+
+        ax2.set_title('Макронутриенты (граммы)', fontsize=14, fontweight='bold')
+        ax2.set_ylabel('Граммы', fontsize=12)
+
+        # Подписи на столбцах
+        for bar, grams in zip(bars, gram_data):
+            ax2.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 5,
+                    f'{grams:.0f}г', ha='center', va='bottom', fontsize=10)
+
+        ax2.grid(True, alpha=0.3)
+
+        fig.tight_layout()
+        return _to_png(fig)
+
+def render_activity_chart(steps_data: List[Dict], days: int, weight: float) -> Optional[bytes]:
+    """График активности (шаги + калории от шагов)"""
+    if not steps_data:
+        return None
+
+    with matplotlib.rc_context(CHART_STYLE):
+        # Подготавливаем данные
+        df = pd.DataFrame(steps_data)
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date')
+        df['steps'] = df['steps'].fillna(0)
+
+        # Рассчитываем калории от шагов
+        df['calories_from_steps'] = df['steps'] * weight * 0.00035
+
+        # Создаем график с двумя осями Y
+        fig = _new_figure(figsize=(12, 6))
+        ax1 = fig.subplots()
+
+        # График шагов
+        color1 = '#1f77b4'
+        ax1.set_xlabel('Дата', fontsize=12)
+        ax1.set_ylabel('Шаги', color=color1, fontsize=12)
+        bars1 = ax1.bar(df['date'], df['steps'], alpha=0.7, color=color1, label='Шаги')
+        ax1.tick_params(axis='y', labelcolor=color1)
+
+        # Вторая ось для калорий
+        ax2 = ax1.twinx()
+        color2 = '#ff7f0e'
+        ax2.set_ylabel('Калории от шагов', color=color2, fontsize=12)
+        ax2.plot(df['date'], df['calories_from_steps'],
+                 color=color2, marker='o', linewidth=2, label='Калории')
+        ax2.tick_params(axis='y', labelcolor=color2)
+
+        # Оформление
+        ax1.set_title(f'👣 Активность за {days} дней', fontsize=16, fontweight='bold', pad=20)
+
+        # Форматирование дат
+        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+        ax1.tick_params(axis='x', labelrotation=45)
+
+        # Подписи на столбцах шагов
+        for bar, steps in zip(bars1, df['steps']):
+            if steps > 0:
+                ax1.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 100,
+                        f'{int(steps):,}', ha='center', va='bottom', fontsize=9)
+
+        # Статистика
+        avg_steps = df['steps'].mean()
+        total_calories = df['calories_from_steps'].sum()
+        stats_text = f"Среднее: {avg_steps:.0f} шагов/день\nВсего сожжено: {total_calories:.0f} ккал"
+        ax1.text(0.02, 0.98, stats_text, transform=ax1.transAxes,
+                fontsize=11, verticalalignment='top',
+                bbox=dict(boxstyle='round', facecolor='lightgreen', alpha=0.8))
+
+        ax1.grid(True, alpha=0.3)
+        fig.tight_layout()
+        return _to_png(fig)
+
+def render(render_name: str, *args) -> Optional[bytes]:
+    """Вызывается в процессе пула: render_name — имя одной из функций render_*_chart"""
+    return globals()[render_name](*args)
+
+def warm_up() -> None:
+    """Вызывается в процессе пула при прогреве: модуль уже импортирован, процесс поднят"""
@@ -1,15 +1,123 @@
+import logging
 import os
 import re
 import json
-from base64 import b64encode
-from openai import OpenAI
+import random
+import asyncio
+from typing import Callable
+from openai import (
+    AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+)
 from dotenv import load_dotenv
+from clients import food_db
+from clients.food_db import split_items
+from clients.food_schema import FOOD_RESPONSE_FORMAT, FoodSchemaError, parse_food_analysis
+from clients.log import log_sampled
+from clients.metrics import LLM_INFLIGHT, LLM_WAITING, observe, timed
+from clients.result_cache import ResultCache
+
+log = logging.getLogger(__name__)
 
 # Загружаем переменные окружения
 load_dotenv()
 
-# Инициализируем OpenAI клиент
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Ограничения для запросов к OpenAI
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_VISION_TIMEOUT = float(os.getenv("OPENAI_VISION_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8"))
+# Ответ analyze_food: предел длины и сколько раз просить модель исправить невалидный ответ
+FOOD_MAX_TOKENS = int(os.getenv("FOOD_MAX_TOKENS", "1200"))
+FOOD_REPAIR_ATTEMPTS = int(os.getenv("FOOD_REPAIR_ATTEMPTS", "1"))
+
+# Общий асинхронный OpenAI клиент (ретраи делаем сами, с джиттером)
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+# Глобальное ограничение числа одновременных запросов к OpenAI
+_llm_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+def _is_retryable(error: Exception) -> bool:
+    """429, 5xx, таймауты и сетевые ошибки можно повторить"""
+    if isinstance(error, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Экспоненциальная задержка с полным джиттером (но не меньше Retry-After)"""
+    cap = min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * 2 ** attempt)
+    delay = random.uniform(0, cap)
+    if isinstance(error, APIStatusError):
+        try:
+            delay = max(delay, float(error.response.headers.get("retry-after", 0)))
+        except ValueError:
+            pass
+    return delay
+
+async def _with_retries(call, model: str):
+    """
+    Выполняет call() под общим семафором: не больше OPENAI_MAX_CONCURRENCY
+    запросов одновременно, повтор с джиттером при 429/5xx.
+    """
+    attempt = 0
+    while True:
+        try:
+            with LLM_WAITING.track_inprogress():
+                await _llm_semaphore.acquire()
+            try:
+                with LLM_INFLIGHT.track_inprogress(), observe("openai", model):
+                    return await call()
+            finally:
+                _llm_semaphore.release()
+        except Exception as e:
+            if attempt >= OPENAI_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt, e)
+            attempt += 1
+            log.warning("⚠️ OpenAI request failed (%s), retry %d/%d in %.1fs", e, attempt, OPENAI_MAX_RETRIES, delay)
+            await asyncio.sleep(delay)
+
+async def chat_completion(*, timeout: float = OPENAI_TIMEOUT, **kwargs):
+    """Вызывает chat.completions.create через общий клиент (семафор, таймаут, ретраи)"""
+    return await _with_retries(
+        lambda: client.chat.completions.create(timeout=timeout, **kwargs),
+        kwargs.get("model", "")
+    )
+
+async def stream_completion(on_text: Callable[[str], None], *, timeout: float = OPENAI_TIMEOUT, **kwargs) -> str:
+    """
+    То же, что chat_completion, но со stream=True: on_text получает весь
+    накопленный текст после каждого фрагмента, возвращается полный ответ.
+    Семафор держится, пока поток не дочитан. В начале каждой попытки on_text
+    получает пустую строку: при повторе текст начинается заново.
+    """
+    async def call() -> str:
+        parts = []
+        on_text("")
+        stream = await client.chat.completions.create(timeout=timeout, stream=True, **kwargs)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                on_text("".join(parts))
+        return "".join(parts)
+
+    return await _with_retries(call, kwargs.get("model", ""))
+
+# ───────────────────────── Кэш analyze_food ─────────────────────────
+food_cache = ResultCache(
+    os.getenv("FOOD_CACHE_PATH", "food_cache.sqlite3"),
+    ttl=float(os.getenv("FOOD_CACHE_TTL", str(30 * 24 * 3600))),
+    max_rows=int(os.getenv("FOOD_CACHE_MAX_ROWS", "20000")),
+    memory_size=int(os.getenv("FOOD_CACHE_MEMORY_SIZE", "512")),
+)
+
+def normalize_description(description: str) -> str:
+    """
+    Ключ кэша для описания еды: нижний регистр, схлопнутые пробелы,
+    канонические единицы («60 гр» → «60г», «0,5 кг» → «500г») и отсортированные позиции.
+    """
+    return ", ".join(sorted(split_items(description)))
 
 def reconcile_total(data: dict) -> dict:
     """
@@ -27,84 +135,200 @@ def reconcile_total(data: dict) -> dict:
         data["total"] = calc
     return data
 
-def analyze_food(description: str) -> dict:
-    prompt = f"""
-Ты нутрициолог. Проанализируй следующее описание еды и рассчитай:
-- Калории (целое число, ккал)
-- Белки (в граммах, 1 знак после запятой)
-- Жиры (в граммах, 1 знак после запятой)
-- Углеводы (в граммах, 1 знак после запятой)
-
-Также составь таблицу по каждому продукту с расчётом:
-- Название
-- Калории
-- Белки
-- Жиры
-- Углеводы
-
-Описание еды:
-{description}
-
-Ответ верни строго в виде JSON в следующем формате:
-{{
-  "total": {{
-    "calories": 1234,
-    "protein": 120.5,
-    "fat": 60.2,
-    "carbs": 150.1
-  }},
-  "breakdown": [
-    {{
-      "item": "картофель 200г",
-      "calories": 170,
-      "protein": 4.0,
-      "fat": 0.4,
-      "carbs": 40.0
-    }}
-  ]
-}}
-"""
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-        )
-        raw = response.choices[0].message.content.strip()
-        print("🧾 [analyze_food] RAW GPT OUTPUT:\n", raw)
+class BreakdownParser:
+    """
+    Достаёт готовые элементы массива "breakdown" из ещё не дописанного JSON.
+    feed() вызывается с накопленным текстом и возвращает только новые позиции;
+    restart() — когда текст начался заново (повтор запроса), уже отданные
+    позиции второй раз не возвращаются.
+    """
+    _decoder = json.JSONDecoder()
+    _start_re = re.compile(r'"breakdown"\s*:\s*\[')
+    _sep_re = re.compile(r"[\s,]*")
+
+    def __init__(self):
+        self.emitted = 0
+        self.restart()
+
+    def restart(self) -> None:
+        self.pos: int | None = None
+        self.index = 0
+
+    def feed(self, text: str) -> list[dict]:
+        if self.pos is None:
+            match = self._start_re.search(text)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        items = []
+        while True:
+            start = self._sep_re.match(text, self.pos).end()
+            if start >= len(text) or text[start] != "{":
+                break
+            try:
+                item, self.pos = self._decoder.raw_decode(text, start)
+            except json.JSONDecodeError:
+                break  # объект ещё не дописан
+            self.index += 1
+            if self.index > self.emitted and isinstance(item, dict) and "item" in item:
+                self.emitted = self.index
+                items.append(item)
+        return items
+
+@timed("food")
+async def analyze_food(description: str, on_item: Callable[[dict], None] | None = None) -> dict:
+    """
+    Разбор описания еды по КБЖУ.
+    Подробное описание («гречка 150г, …») сначала считается по локальной
+    таблице (clients.food_db), в LLM уходят только позиции, которых в ней нет.
+    С on_item ответ модели читается потоком, и on_item вызывается для каждой
+    позиции breakdown, как только она готова (из кэша — не вызывается).
+    """
+    key = normalize_description(description)
+    cached = await food_cache.aget(key)
+    if cached:
+        return cached
+
+    local, pending = [], description
+    if is_detailed_description(description):
+        resolution = food_db.resolve(description)
+        local, pending = resolution.breakdown, ", ".join(resolution.unresolved)
+        if on_item:
+            for item in local:
+                on_item(item)
+
+    if not pending:
+        result = food_db.build_result(local)
+    else:
+        result = await _analyze_food_llm(pending, on_item)
+        if result and local:
+            result = food_db.build_result(local + result["breakdown"])
+    if result:
+        await food_cache.aput(key, result)
+    return result
+
+# Короткий системный промпт: форму ответа задаёт JSON Schema (clients.food_schema)
+FOOD_SYSTEM_PROMPT = (
+    "Ты нутрициолог. Разбери описание еды по продуктам: для каждого укажи калории "
+    "(ккал, целое число), белки, жиры и углеводы (г, 1 знак после запятой), затем итог."
+)
+FOOD_IMAGE_SYSTEM_PROMPT = (
+    "Ты нутрициолог. Определи продукты на фото и их примерный вес, в item пиши "
+    "«название 100г». Для каждого укажи калории (ккал, целое число), белки, жиры и "
+    "углеводы (г, 1 знак после запятой), затем итог. Если еды на фото нет — пустой breakdown."
+)
 
-        if raw.startswith("```"):
-            raw = re.sub(r"^```[a-zA-Z]*\n?", "", raw)
-            raw = re.sub(r"\n?```$", "", raw).strip()
-        start = raw.find("{")
-        end = raw.rfind("}") + 1
-        json_str = raw[start:end]
+async def _food_completion(
+    messages: list[dict],
+    on_item: Callable[[dict], None] | None = None,
+    *,
+    model: str = "gpt-4o-mini",
+    timeout: float = OPENAI_TIMEOUT,
+) -> str:
+    request = dict(
+        timeout=timeout,
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=FOOD_MAX_TOKENS,
+        response_format=FOOD_RESPONSE_FORMAT,
+    )
+    if on_item is None:
+        message = (await chat_completion(**request)).choices[0].message
+        if getattr(message, "refusal", None):
+            raise RuntimeError(f"model refused: {message.refusal}")
+        return message.content or ""
 
-        print("📦 [analyze_food] Extracted JSON:\n", json_str)
+    parser = BreakdownParser()
 
-        data = json.loads(json_str)
-        return reconcile_total(data)
+    def on_text(text: str) -> None:
+        if not text:
+            parser.restart()
+            return
+        for item in parser.feed(text):
+            on_item(item)
+
+    return await stream_completion(on_text, **request)
+
+async def _structured_food_analysis(
+    messages: list[dict],
+    on_item: Callable[[dict], None] | None = None,
+    *,
+    allow_empty: bool = False,
+    **options,
+) -> dict:
+    """
+    Ответ проверяется по схеме; если он не прошёл проверку (обрезан, битый JSON,
+    отрицательные числа), модели до FOOD_REPAIR_ATTEMPTS раз возвращается
+    её ответ с текстом ошибки. Повторные запросы — без потока.
+    """
+    try:
+        raw = await _food_completion(messages, on_item, **options)
+        for attempt in range(FOOD_REPAIR_ATTEMPTS + 1):
+            log_sampled(log, "analyze_food.raw", "analyze_food raw output: %s", raw)
+            try:
+                analysis = parse_food_analysis(raw, allow_empty=allow_empty)
+                break
+            except FoodSchemaError as e:
+                if attempt >= FOOD_REPAIR_ATTEMPTS:
+                    raise
+                log.warning("⚠️ analyze_food reply failed validation (%s), asking for a fix", e)
+                messages = [
+                    *messages,
+                    {"role": "assistant", "content": raw},
+                    {"role": "user", "content": f"Ответ не прошёл проверку: {e}. Верни исправленный JSON."},
+                ]
+                raw = await _food_completion(messages, **options)
+        if not analysis.breakdown:
+            return {}
+        return reconcile_total(analysis.to_dict())
     except Exception as e:
-        print("❌ GPT parsing error:", e)
+        log.error("❌ GPT parsing error: %s", e)
         return {}
 
-async def detect_food_items_from_image(image_bytes: bytes) -> str:
-    """Определяет названия и веса продуктов по изображению"""
+async def _analyze_food_llm(description: str, on_item: Callable[[dict], None] | None = None) -> dict:
+    messages = [
+        {"role": "system", "content": FOOD_SYSTEM_PROMPT},
+        {"role": "user", "content": description},
+    ]
+    return await _structured_food_analysis(messages, on_item)
+
+@timed("food", "analyze_food_image")
+async def analyze_food_image(image_url: str, hint: str = "", on_item: Callable[[dict], None] | None = None) -> dict:
+    """
+    Разбор фото еды по КБЖУ одним запросом к vision-модели (вместо
+    detect_food_items_from_image + analyze_food). Возвращает то же, что
+    analyze_food; если еды на фото нет — {}. hint — подпись к фото.
+    """
+    content = [
+        {"type": "image_url", "image_url": {"url": image_url}},
+        {"type": "text", "text": f"Подпись: {hint}" if hint else "Оцени вес каждого продукта на фото."},
+    ]
+    messages = [
+        {"role": "system", "content": FOOD_IMAGE_SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+    return await _structured_food_analysis(
+        messages, on_item, allow_empty=True, model="gpt-4o", timeout=OPENAI_VISION_TIMEOUT
+    )
+
+@timed("food")
+async def detect_food_items_from_image(image_url: str) -> str:
+    """Определяет названия и веса продуктов по изображению (URL или data URL)"""
     try:
-        encoded = b64encode(image_bytes).decode("utf-8")
         prompt = (
             "Посмотри на фото и назови продукты с примерным весом. "
             "Формат: название 100г, продукт 50г. Без пояснений."
         )
 
-        print("📤 [detect_food_items_from_image] Sending image prompt...")
-
-        response = client.chat.completions.create(
+        response = await chat_completion(
+            timeout=OPENAI_VISION_TIMEOUT,
             model="gpt-4o",
             messages=[{
                 "role": "user",
                 "content": [
-                    {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + encoded}},
+                    {"type": "image_url", "image_url": {"url": image_url}},
                     {"type": "text", "text": prompt}
                 ]
             }],
@@ -112,11 +336,11 @@ async def detect_food_items_from_image(image_bytes: bytes) -> str:
         )
 
         raw = response.choices[0].message.content.strip()
-        print("🖼️ [detect_food_items_from_image] RAW GPT OUTPUT:\n", raw)
+        log_sampled(log, "detect_food_items.raw", "detect_food_items_from_image raw output: %s", raw)
         return raw
 
     except Exception as e:
-        print(f"❌ [detect_food_items_from_image] Image ingredient detection error: {e}")
+        log.error("❌ Image ingredient detection error: %s", e)
         return ""
 
 
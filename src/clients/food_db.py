@@ -0,0 +1,243 @@
+"""
+Локальная таблица калорийности продуктов 🥦
+──────────────────────────────────────────
+Быстрый путь для подробных описаний вида «куриная грудка 200г, кабачок 100г»,
+без запроса к LLM:
+• data/foods.csv – КБЖУ на 100 г (мл считаются граммами), для штучных
+  продуктов — вес одной штуки
+• индекс названий и синонимов: нижний регистр, ё → е, латиница → кириллица
+  («kurinaya grudka»), окончания отбрасываются, порядок слов не важен;
+  неточные совпадения ищет difflib с оценкой не ниже FOOD_DB_MIN_SCORE,
+  числа в названии («творог 9%») должны совпадать точно
+• resolve(description) – делит описание на позиции «название количество единица»
+  (штучный продукт без количества — одна штука), считает найденные и возвращает
+  остальные как нераспознанные (их считает LLM)
+• build_result(breakdown) – {"total", "breakdown"} в формате analyze_food
+
+Таблица загружается при первом обращении.
+"""
+import csv
+import difflib
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+from clients.metrics import FOOD_ITEMS
+
+log = logging.getLogger(__name__)
+
+FOOD_DB_PATH = os.getenv("FOOD_DB_PATH", str(Path(__file__).parent / "data" / "foods.csv"))
+FOOD_DB_MIN_SCORE = float(os.getenv("FOOD_DB_MIN_SCORE", "0.86"))
+# Порции больше — скорее опечатка в описании, такие позиции отдаём LLM
+MAX_ITEM_GRAMS = 3000
+
+# ───────────────────────── разбор описания ─────────────────────────
+
+# Варианты записи единиц → (каноническая единица, множитель)
+UNITS = {
+    "г": ("г", 1), "гр": ("г", 1), "грам": ("г", 1), "грамм": ("г", 1),
+    "грамма": ("г", 1), "граммов": ("г", 1), "g": ("г", 1), "gr": ("г", 1),
+    "кг": ("г", 1000), "kg": ("г", 1000),
+    "мл": ("мл", 1), "ml": ("мл", 1),
+    "л": ("мл", 1000), "l": ("мл", 1000),
+    "шт": ("шт", 1), "штук": ("шт", 1), "штуки": ("шт", 1), "штука": ("шт", 1), "pcs": ("шт", 1),
+}
+QTY_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")\.?(?![a-zа-я])")
+ITEM_SPLIT_RE = re.compile(r"(?<!\d),|,(?!\d)|[;\n+]")
+
+# Количество после canonical_qty и «2 яйца» без единицы
+_CANONICAL_QTY_RE = re.compile(r"(\d+(?:\.\d+)?)(г|мл|шт)")
+_COUNT_RE = re.compile(r"(?<![\d.])(\d{1,2})(?![\d.%])")
+_TOKEN_RE = re.compile(r"[a-zа-я0-9.%]+")
+
+def canonical_qty(match: re.Match) -> str:
+    unit, factor = UNITS[match.group(2)]
+    qty = float(match.group(1).replace(",", ".")) * factor
+    return f"{qty:g}{unit}"
+
+def split_items(text: str) -> list[str]:
+    """Позиции описания: нижний регистр, схлопнутые пробелы, канонические единицы («0,5 кг» → «500г»)"""
+    items = []
+    for item in ITEM_SPLIT_RE.split(text.lower().replace("ё", "е")):
+        item = " ".join(item.split())
+        item = QTY_RE.sub(canonical_qty, item)
+        if item:
+            items.append(item)
+    return items
+
+def _parse_item(item: str) -> tuple[str, float | None, str | None]:
+    """«куриная грудка 200г» → ("куриная грудка", 200.0, "г"); «2 яйца» → ("яйца", 2.0, "шт")"""
+    match = _CANONICAL_QTY_RE.search(item) or _COUNT_RE.search(item)
+    if not match:
+        return item, None, None
+    unit = match.group(2) if match.re is _CANONICAL_QTY_RE else "шт"
+    name = " ".join((item[:match.start()] + " " + item[match.end():]).split())
+    return name, float(match.group(1)), unit
+
+# ───────────────────────── нормализация названий ─────────────────────────
+
+_TRANSLIT = {
+    "shch": "щ", "sch": "щ", "zh": "ж", "kh": "х", "ch": "ч", "sh": "ш", "ts": "ц",
+    "yu": "ю", "ya": "я", "yo": "йо", "ye": "е",
+    "a": "а", "b": "б", "c": "к", "d": "д", "e": "е", "f": "ф", "g": "г", "h": "х",
+    "i": "и", "j": "й", "k": "к", "l": "л", "m": "м", "n": "н", "o": "о", "p": "п",
+    "q": "к", "r": "р", "s": "с", "t": "т", "u": "у", "v": "в", "w": "в", "x": "кс", "z": "з",
+}
+_TRANSLIT_RE = re.compile("|".join(sorted(_TRANSLIT, key=len, reverse=True)) + "|y")
+_VOWELS = set("aeiouy")
+
+def _translit_char(match: re.Match) -> str:
+    text, pos = match.string, match.start()
+    if match.group() != "y":
+        return _TRANSLIT[match.group()]
+    # «syr» → сыр, но «yaytso» → яйцо, «kiy» → кий
+    after_consonant = pos > 0 and text[pos - 1].isalpha() and text[pos - 1] not in _VOWELS
+    before_consonant = pos + 1 < len(text) and text[pos + 1].isalpha() and text[pos + 1] not in _VOWELS
+    return "ы" if after_consonant and before_consonant else "й"
+
+def transliterate(text: str) -> str:
+    """Латиница → кириллица по привычной записи («kurinaya grudka» → «куриная грудка»)"""
+    return _TRANSLIT_RE.sub(_translit_char, text)
+
+_ENDINGS = sorted(
+    ["ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ая", "яя", "ое", "ее", "ые", "ие",
+     "ый", "ий", "ой", "ей", "ам", "ям", "ах", "ях", "ом", "ем", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь"],
+    key=len, reverse=True
+)
+
+def _stem(word: str) -> str:
+    """Грубо отбрасывает окончание русского слова: «гречки», «гречка» → «гречк»"""
+    if len(word) < 4 or not ("а" <= word[-1] <= "я"):
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+def name_key(name: str) -> str:
+    """Ключ индекса: основы слов в алфавитном порядке"""
+    return " ".join(sorted(_stem(token) for token in _TOKEN_RE.findall(name.lower().replace("ё", "е"))))
+
+def _numbers(key: str) -> frozenset[str]:
+    return frozenset(token for token in key.split() if token[0].isdigit())
+
+# ───────────────────────── таблица ─────────────────────────
+
+@dataclass(frozen=True)
+class Food:
+    name: str
+    calories: float
+    protein: float
+    fat: float
+    carbs: float
+    piece_grams: float | None = None
+
+    def portion(self, label: str, grams: float) -> dict:
+        """Позиция breakdown для порции в граммах"""
+        k = grams / 100
+        return {
+            "item": label,
+            "calories": round(self.calories * k),
+            "protein": round(self.protein * k, 1),
+            "fat": round(self.fat * k, 1),
+            "carbs": round(self.carbs * k, 1),
+        }
+
+class FoodIndex:
+    """Продукты по ключам названий и синонимов; неточный поиск только среди ключей с теми же числами"""
+
+    def __init__(self, foods: list[tuple[Food, list[str]]]):
+        self.by_key: dict[str, Food] = {}
+        self.keys_by_numbers: dict[frozenset[str], list[str]] = {}
+        for food, aliases in foods:
+            for alias in [food.name, *aliases]:
+                key = name_key(alias)
+                if key and key not in self.by_key:
+                    self.by_key[key] = food
+                    self.keys_by_numbers.setdefault(_numbers(key), []).append(key)
+
+    @classmethod
+    def load(cls, path: str) -> "FoodIndex":
+        foods = []
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                food = Food(
+                    name=row["name"],
+                    calories=float(row["calories"]),
+                    protein=float(row["protein"]),
+                    fat=float(row["fat"]),
+                    carbs=float(row["carbs"]),
+                    piece_grams=float(row["piece_grams"]) if row["piece_grams"] else None,
+                )
+                foods.append((food, [a for a in row["aliases"].split("|") if a]))
+        log.debug("🥦 Loaded %d foods from %s", len(foods), path)
+        return cls(foods)
+
+    def lookup(self, name: str) -> Food | None:
+        keys = [name_key(name)]
+        if re.search("[a-z]", name):
+            keys.append(name_key(transliterate(name)))
+        for key in keys:
+            if key in self.by_key:
+                return self.by_key[key]
+        for key in keys:
+            candidates = self.keys_by_numbers.get(_numbers(key), [])
+            match = difflib.get_close_matches(key, candidates, n=1, cutoff=FOOD_DB_MIN_SCORE)
+            if match:
+                return self.by_key[match[0]]
+        return None
+
+_index: FoodIndex | None = None
+
+def get_index() -> FoodIndex:
+    global _index
+    if _index is None:
+        _index = FoodIndex.load(FOOD_DB_PATH)
+    return _index
+
+@lru_cache(maxsize=4096)
+def lookup(name: str) -> Food | None:
+    return get_index().lookup(name)
+
+# ───────────────────────── расчёт ─────────────────────────
+
+@dataclass
+class Resolution:
+    breakdown: list[dict] = field(default_factory=list)
+    unresolved: list[str] = field(default_factory=list)
+
+def resolve(description: str) -> Resolution:
+    """Считает по таблице позиции, для которых уверенно найден продукт и понятен вес"""
+    result = Resolution()
+    for item in split_items(description):
+        name, qty, unit = _parse_item(item)
+        food = lookup(name) if name else None
+        grams = None
+        if food is not None:
+            if unit is None:
+                grams = food.piece_grams  # «яблоко» — одна штука
+            elif unit != "шт":
+                grams = qty
+            elif food.piece_grams:
+                grams = qty * food.piece_grams
+        if food is None or grams is None or not 0 < grams <= MAX_ITEM_GRAMS:
+            result.unresolved.append(item)
+            continue
+        result.breakdown.append(food.portion(item, grams))
+
+    FOOD_ITEMS.labels("local").inc(len(result.breakdown))
+    FOOD_ITEMS.labels("llm").inc(len(result.unresolved))
+    return result
+
+def build_result(breakdown: list[dict]) -> dict:
+    """{"total", "breakdown"} — как возвращает analyze_food"""
+    total = {
+        "calories": sum(item["calories"] for item in breakdown),
+        "protein": round(sum(item["protein"] for item in breakdown), 1),
+        "fat": round(sum(item["fat"] for item in breakdown), 1),
+        "carbs": round(sum(item["carbs"] for item in breakdown), 1),
+    }
+    return {"total": total, "breakdown": breakdown}
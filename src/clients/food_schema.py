@@ -0,0 +1,113 @@
+"""
+Схема ответа analyze_food 📐
+───────────────────────────
+• FOOD_RESPONSE_FORMAT – response_format для OpenAI (strict JSON Schema):
+  модель не может вернуть ничего, кроме объекта нужной формы;
+  breakdown идёт перед total, чтобы при потоковом чтении позиции приходили первыми
+• FoodItem / Nutrients / FoodAnalysis – проверенный ответ
+• parse_food_analysis(raw) – json.loads и проверка типов и значений;
+  при ошибке FoodSchemaError с текстом, который можно вернуть модели на исправление
+"""
+import json
+import math
+from dataclasses import asdict, dataclass
+
+# Больше позиций в одном приёме пищи — скорее сбой генерации
+MAX_ITEMS = 50
+
+_NUTRIENT_PROPERTIES = {
+    "calories": {"type": "integer"},
+    "protein": {"type": "number"},
+    "fat": {"type": "number"},
+    "carbs": {"type": "number"},
+}
+
+FOOD_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "breakdown": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"item": {"type": "string"}, **_NUTRIENT_PROPERTIES},
+                "required": ["item", *_NUTRIENT_PROPERTIES],
+                "additionalProperties": False,
+            },
+        },
+        "total": {
+            "type": "object",
+            "properties": _NUTRIENT_PROPERTIES,
+            "required": list(_NUTRIENT_PROPERTIES),
+            "additionalProperties": False,
+        },
+    },
+    "required": ["breakdown", "total"],
+    "additionalProperties": False,
+}
+
+FOOD_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "food_analysis", "strict": True, "schema": FOOD_ANALYSIS_SCHEMA},
+}
+
+class FoodSchemaError(ValueError):
+    """Ответ модели не соответствует схеме"""
+
+@dataclass(frozen=True)
+class Nutrients:
+    calories: float
+    protein: float
+    fat: float
+    carbs: float
+
+@dataclass(frozen=True)
+class FoodItem(Nutrients):
+    item: str
+
+@dataclass(frozen=True)
+class FoodAnalysis:
+    breakdown: list[FoodItem]
+    total: Nutrients
+
+    def to_dict(self) -> dict:
+        """{"total", "breakdown"} — формат, в котором analyze_food отдаёт и кэширует результат"""
+        return {"total": asdict(self.total), "breakdown": [asdict(item) for item in self.breakdown]}
+
+def _object(value, path: str) -> dict:
+    if not isinstance(value, dict):
+        raise FoodSchemaError(f"{path}: ожидался объект")
+    return value
+
+def _nutrients(data: dict, path: str) -> dict:
+    values = {}
+    for key in _NUTRIENT_PROPERTIES:
+        value = data.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise FoodSchemaError(f"{path}.{key}: ожидалось неотрицательное число, получено {value!r}")
+        values[key] = value
+    return values
+
+def parse_food_analysis(raw: str, *, allow_empty: bool = False) -> FoodAnalysis:
+    """allow_empty — пустой breakdown допустим (на фото нет еды)"""
+    try:
+        data = _object(json.loads(raw), "ответ")
+    except json.JSONDecodeError as e:
+        raise FoodSchemaError(f"некорректный JSON: {e}") from None
+
+    breakdown = data.get("breakdown")
+    if not isinstance(breakdown, list) or not (breakdown or allow_empty):
+        raise FoodSchemaError("breakdown: ожидался непустой массив")
+    if len(breakdown) > MAX_ITEMS:
+        raise FoodSchemaError(f"breakdown: больше {MAX_ITEMS} позиций")
+
+    items = []
+    for index, row in enumerate(breakdown):
+        path = f"breakdown[{index}]"
+        row = _object(row, path)
+        name = row.get("item")
+        if not isinstance(name, str) or not name.strip():
+            raise FoodSchemaError(f"{path}.item: ожидалось название продукта")
+        items.append(FoodItem(item=name.strip(), **_nutrients(row, path)))
+
+    total = Nutrients(**_nutrients(_object(data.get("total"), "total"), "total"))
+    return FoodAnalysis(breakdown=items, total=total)
@@ -0,0 +1,157 @@
+"""
+Работа с фото еды 🖼️
+────────────────────
+• pick_photo_size – самый маленький PhotoSize, которого хватает для распознавания
+• prepare_photo – одно декодирование: перцептивный хэш + уменьшение и
+  пережатие в JPEG ограниченного размера
+• to_data_url – data URL для vision-запроса с минимумом копий
+• dhash – перцептивный хэш изображения (64 бита)
+• PhotoResultCache – ограниченный кэш результатов распознавания фото
+  отдельно для каждого пользователя, поиск по расстоянию Хэмминга между
+  хэшами (пересланные, повторно отправленные и почти одинаковые фото
+  не требуют нового vision-запроса)
+"""
+import io
+import os
+import threading
+from base64 import b64encode
+from collections import OrderedDict
+
+from PIL import Image
+
+PHOTO_CACHE_SIZE = int(os.getenv("PHOTO_CACHE_SIZE", "1000"))
+# Допустимое расстояние Хэмминга (из 64 бит); больше 3 не бывает — см. PhotoResultCache
+PHOTO_HASH_THRESHOLD = int(os.getenv("PHOTO_HASH_THRESHOLD", "2"))
+
+# Параметры подготовки фото для vision-модели
+PHOTO_TARGET_SIDE = int(os.getenv("PHOTO_TARGET_SIDE", "768"))
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1024"))
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", "200000"))
+PHOTO_JPEG_QUALITIES = (85, 75, 65, 50)
+
+_DATA_URL_PREFIX = b"data:image/jpeg;base64,"
+
+# Что может выбросить prepare_photo на битом или неподдерживаемом файле
+# (UnidentifiedImageError и обрезанные файлы — OSError, ошибки EXIF — ValueError)
+PHOTO_DECODE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+def pick_photo_size(photo_sizes):
+    """Возвращает самый маленький вариант фото, у которого большая сторона ≥ PHOTO_TARGET_SIDE"""
+    by_area = sorted(photo_sizes, key=lambda p: p.width * p.height)
+    for size in by_area:
+        if max(size.width, size.height) >= PHOTO_TARGET_SIDE:
+            return size
+    return by_area[-1]
+
+def prepare_photo(data: io.BytesIO) -> tuple[bytes, int]:
+    """
+    Декодирует фото один раз и возвращает (JPEG для vision-запроса, dhash).
+    Фото уменьшается до PHOTO_MAX_SIDE и пережимается, пока не уложится в PHOTO_MAX_BYTES.
+    """
+    with Image.open(data) as img:
+        img_hash = _dhash_image(img)
+        original_size = data.getbuffer().nbytes
+        if max(img.size) <= PHOTO_MAX_SIDE and original_size <= PHOTO_MAX_BYTES and img.format == "JPEG":
+            return data.getvalue(), img_hash
+
+        img = img.convert("RGB")
+        img.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        for quality in PHOTO_JPEG_QUALITIES:
+            out.seek(0)
+            out.truncate()
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            if out.tell() <= PHOTO_MAX_BYTES:
+                return out.getvalue(), img_hash
+
+        # Даже минимальное качество не помогло — уменьшаем дальше
+        while out.tell() > PHOTO_MAX_BYTES and min(img.size) > 256:
+            img = img.resize((img.width * 3 // 4, img.height * 3 // 4), Image.Resampling.LANCZOS)
+            out.seek(0)
+            out.truncate()
+            img.save(out, format="JPEG", quality=PHOTO_JPEG_QUALITIES[-1], optimize=True)
+        return out.getvalue(), img_hash
+
+def to_data_url(jpeg: bytes) -> str:
+    """data:image/jpeg;base64,… — одно кодирование и одно декодирование в str"""
+    return (_DATA_URL_PREFIX + b64encode(jpeg)).decode("ascii")
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """Difference hash: сравнивает яркость соседних пикселей уменьшенного ч/б изображения"""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return _dhash_image(img, hash_size)
+
+def _dhash_image(img: Image.Image, hash_size: int = 8) -> int:
+    pixels = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+# Хэш делится на 4 полосы по 16 бит: хэши на расстоянии ≤ 3 совпадают хотя бы в одной
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+def _bands(image_hash: int):
+    for band in range(_BANDS):
+        yield band, (image_hash >> (band * _BAND_BITS)) & _BAND_MASK
+
+class PhotoResultCache:
+    """
+    Кэш результатов по перцептивному хэшу с порогом расстояния Хэмминга.
+    Записи разделены по scope (user_id): похожее фото другого пользователя
+    не вернёт чужой результат. Кандидаты ищутся по совпадающей 16-битной
+    полосе хэша, а не перебором всего кэша, поэтому порог не больше 3.
+    """
+
+    def __init__(self, max_size: int = PHOTO_CACHE_SIZE, threshold: int = PHOTO_HASH_THRESHOLD):
+        self.max_size = max_size
+        self.threshold = min(threshold, _BANDS - 1)
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries: OrderedDict[tuple, object] = OrderedDict()
+        # (scope, номер полосы, значение полосы) → хэши с такой полосой
+        self._bands: dict[tuple, set[int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope, image_hash: int):
+        """Возвращает результат для самого похожего фото этого scope в пределах порога"""
+        with self._lock:
+            best_hash, best_distance = None, self.threshold + 1
+            if (scope, image_hash) in self._entries:
+                best_hash = image_hash
+            else:
+                for band, value in _bands(image_hash):
+                    for known_hash in self._bands.get((scope, band, value), ()):
+                        distance = hamming_distance(image_hash, known_hash)
+                        if distance < best_distance:
+                            best_hash, best_distance = known_hash, distance
+
+            if best_hash is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end((scope, best_hash))
+            self.stats["hits"] += 1
+            return self._entries[(scope, best_hash)]
+
+    def put(self, scope, image_hash: int, result) -> None:
+        with self._lock:
+            key = (scope, image_hash)
+            if key not in self._entries:
+                for band, value in _bands(image_hash):
+                    self._bands.setdefault((scope, band, value), set()).add(image_hash)
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                (old_scope, old_hash), _ = self._entries.popitem(last=False)
+                for band, value in _bands(old_hash):
+                    bucket = self._bands[(old_scope, band, value)]
+                    bucket.discard(old_hash)
+                    if not bucket:
+                        del self._bands[(old_scope, band, value)]
@@ -0,0 +1,127 @@
+"""
+Логирование 📝
+──────────────
+Вместо print(): уровни, настройка по модулям, текстовый или JSON-вывод.
+
+• setup_logging() – вызывается один раз при старте бота
+• запись в stdout идёт из отдельного потока через очередь, поэтому
+  обработчики апдейтов не ждут вывода
+• log_sampled() – debug-сообщение с «тяжёлыми» данными (сырые ответы
+  GPT/Supabase) не чаще раза в LOG_SAMPLE_INTERVAL секунд на ключ;
+  при выключенном DEBUG стоит одну проверку уровня
+
+Модули получают логгер как обычно: log = logging.getLogger(__name__)
+Аргументы передаются отдельно (log.debug("meals: %s", data)), а не f-строкой,
+чтобы строка не собиралась, когда уровень выключен.
+
+Настройки (переменные окружения):
+  LOG_LEVEL           – общий уровень, по умолчанию INFO
+  LOG_LEVELS          – уровни по модулям, напр. "clients.supabase_client=DEBUG,httpx=INFO"
+                        (httpx по умолчанию WARNING, иначе он пишет каждый запрос к Telegram)
+  LOG_FORMAT          – text или json, по умолчанию text
+  LOG_SAMPLE_INTERVAL – секунд между debug-выборками по одному ключу, по умолчанию 60
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "60"))
+
+DEFAULT_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING"}
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Стандартные атрибуты LogRecord — всё остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra= попадают в объект"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    levels = dict(DEFAULT_LEVELS)
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+class _RecordQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не форматирует запись в вызывающем потоке"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Подставляем аргументы сразу (объекты могут измениться), а
+        # форматирование и traceback оставляем потоку-писателю
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+_listener: logging.handlers.QueueListener | None = None
+
+def setup_logging() -> None:
+    """Настраивает корневой логгер: очередь → поток-писатель → stdout"""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [_RecordQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+# ───────────────────────── выборочное логирование ─────────────────────────
+
+_samples: dict[str, list] = {}
+_samples_lock = threading.Lock()
+
+def log_sampled(logger: logging.Logger, key: str, msg: str, *args, interval: float = LOG_SAMPLE_INTERVAL) -> None:
+    """
+    logger.debug(msg, *args), но не чаще раза в interval секунд для key.
+    В запись добавляется число пропущенных с прошлого раза (sampled_skipped).
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    now = time.monotonic()
+    with _samples_lock:
+        sample = _samples.setdefault(key, [float("-inf"), 0])
+        if now - sample[0] < interval:
+            sample[1] += 1
+            return
+        skipped = sample[1]
+        sample[0], sample[1] = now, 0
+    logger.debug(msg, *args, extra={"sampled_skipped": skipped})
@@ -0,0 +1,148 @@
+"""
+Метрики в формате Prometheus 📈
+───────────────────────────────
+• bot_handler_seconds / bot_handler_errors_total – обработчики апдейтов
+  и ежедневные задачи (метка handler)
+• bot_external_call_seconds / bot_external_call_errors_total – внешние
+  вызовы: Supabase, OpenAI, скачивание из Telegram, отрисовка графиков
+  (метки service, operation); service="photo" — разбор фото целиком,
+  operation — PHOTO_ANALYSIS_MODE (two_step / one_shot)
+• bot_llm_inflight / bot_llm_waiting – запросы к OpenAI в работе и в
+  ожидании семафора
+• bot_update_queue_depth / bot_supabase_queue_depth – очереди апдейтов
+  и пула потоков Supabase
+• bot_send_queue_depth – исходящие запросы, ждущие лимита Telegram
+• bot_startup_seconds – этапы запуска от старта процесса (метка stage)
+• bot_food_items_total – позиции описаний еды: посчитаны по локальной
+  таблице или отправлены в LLM (метка source: local / llm)
+
+Инструментирование:
+• observe(service, operation) – контекстный менеджер вокруг вызова
+• timed(service) – то же декоратором (для sync и async функций)
+• instrument_callback / instrument_application – обёртка колбэков
+  обработчиков PTB, включая вложенные в ConversationHandler
+
+Эндпоинт /metrics:
+• METRICS_PORT – отдельный внутренний HTTP-сервер (в обоих режимах)
+• в webhook-режиме ещё и на том же aiohttp-сервере, но только если задан
+  METRICS_TOKEN (порт webhook'а публичный): запрос должен нести заголовок
+  "Authorization: Bearer <token>"; без токена маршрут не регистрируется
+"""
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+)
+from telegram.ext import Application, ConversationHandler
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Время обработки апдейта или задачи",
+    ["handler"], buckets=LATENCY_BUCKETS
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках и задачах", ["handler"]
+)
+CALL_LATENCY = Histogram(
+    "bot_external_call_seconds", "Время внешних вызовов",
+    ["service", "operation"], buckets=LATENCY_BUCKETS
+)
+CALL_ERRORS = Counter(
+    "bot_external_call_errors_total", "Исключения во внешних вызовах", ["service", "operation"]
+)
+LLM_INFLIGHT = Gauge("bot_llm_inflight", "Запросы к OpenAI в работе")
+LLM_WAITING = Gauge("bot_llm_waiting", "Запросы к OpenAI, ждущие семафора")
+UPDATE_QUEUE_DEPTH = Gauge("bot_update_queue_depth", "Апдейты в очереди приложения")
+SUPABASE_QUEUE_DEPTH = Gauge("bot_supabase_queue_depth", "Запросы, ждущие потока Supabase")
+SEND_QUEUE_DEPTH = Gauge("bot_send_queue_depth", "Запросы к Telegram, ждущие лимита отправки")
+STARTUP_SECONDS = Gauge("bot_startup_seconds", "Время этапа запуска от старта процесса", ["stage"])
+FOOD_ITEMS = Counter("bot_food_items_total", "Позиции описаний еды по источнику расчёта", ["source"])
+
+# ───────────────────────── внешние вызовы ─────────────────────────
+
+@contextmanager
+def observe(service: str, operation: str):
+    """Записывает длительность вызова и считает исключения"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        CALL_ERRORS.labels(service, operation).inc()
+        raise
+    finally:
+        CALL_LATENCY.labels(service, operation).observe(time.perf_counter() - start)
+
+def timed(service: str, operation: str | None = None):
+    """Декоратор: observe(service, operation or имя функции) вокруг каждого вызова"""
+    def decorator(func):
+        name = operation or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with observe(service, name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe(service, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ───────────────────────── обработчики PTB ─────────────────────────
+
+def instrument_callback(name: str, callback):
+    """Оборачивает async-колбэк обработчика или задачи метриками bot_handler_*"""
+    if getattr(callback, "_instrumented", False):
+        return callback
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(name).observe(time.perf_counter() - start)
+
+    wrapper._instrumented = True
+    return wrapper
+
+def _instrument_handler(handler) -> None:
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            _instrument_handler(inner)
+        return
+    handler.callback = instrument_callback(handler.callback.__name__, handler.callback)
+
+def instrument_application(application: Application) -> None:
+    """Инструментирует все добавленные обработчики и очередь апдейтов"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+    UPDATE_QUEUE_DEPTH.set_function(application.update_queue.qsize)
+
+# ───────────────────────── экспорт ─────────────────────────
+
+def render_metrics() -> tuple[bytes, str]:
+    """(тело ответа, Content-Type) для эндпоинта /metrics"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def start_metrics_server() -> None:
+    """Отдельный HTTP-сервер для /metrics; без METRICS_PORT ничего не делает"""
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
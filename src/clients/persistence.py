@@ -0,0 +1,231 @@
+"""
+Персистентность состояния бота 💾
+────────────────────────────────
+ctx.user_data / chat_data / bot_data и состояния ConversationHandler'ов
+переживают деплой и перезапуск дино:
+• SupabasePersistence – таблица bot_state в Supabase (sql/003_bot_state.sql),
+  основной вариант: файловая система дино очищается при перезапуске
+• SQLitePersistence – локальный файл SQLite, для разработки и постоянного тома
+
+Запись отложенная и пакетная (общая для обоих, WriteBehindPersistence):
+• Application сам отслеживает изменённых пользователей/чаты и раз в
+  update_interval секунд вызывает update_* только для них
+• update_* лишь помечают ключ «грязным» (никакого I/O в обработке апдейта)
+• через write_delay секунд все грязные ключи пишутся одним пакетом
+  в отдельном потоке; flush() при остановке дописывает остаток
+"""
+import asyncio
+import base64
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+from itertools import groupby
+
+import httpx
+from postgrest.exceptions import APIError
+from telegram.ext import BasePersistence, PersistenceInput
+
+log = logging.getLogger(__name__)
+
+_USER = "user"
+_CHAT = "chat"
+_BOT = "bot"
+_CALLBACK = "callback"
+
+def _conversation_namespace(name: str) -> str:
+    return f"conv:{name}"
+
+class WriteBehindPersistence(BasePersistence):
+    """BasePersistence над хранилищем (namespace, key) → pickle; подклассы реализуют _load и _write_batch"""
+
+    # Ошибки хранилища, при которых пакет возвращается в очередь на запись
+    storage_errors: tuple[type[BaseException], ...] = ()
+
+    def __init__(
+        self,
+        *,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 5,
+        write_delay: float = 1.0,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.write_delay = write_delay
+        self._dirty: dict[tuple[str, str], bytes | None] = {}
+        self._write_task: asyncio.Task | None = None
+
+    def _load(self, namespace: str) -> dict[str, object]:
+        raise NotImplementedError
+
+    def _write_batch(self, batch: dict[tuple[str, str], bytes | None]) -> None:
+        """Пишет пакет: value=None — удалить ключ"""
+        raise NotImplementedError
+
+    # ───────────────────────── отложенная запись ─────────────────────────
+
+    def _mark(self, namespace: str, key, value) -> None:
+        """Помечает ключ изменённым (value=None — удалить) и планирует запись"""
+        self._dirty[(namespace, str(key))] = None if value is None else pickle.dumps(value)
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_later())
+
+    async def _write_later(self) -> None:
+        await asyncio.sleep(self.write_delay)
+        await self._write_dirty()
+
+    async def _write_dirty(self) -> None:
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except self.storage_errors as e:
+            log.error("❌ Failed to persist bot state: %s", e)
+            # Не теряем изменения: вернём их, если новых значений ещё нет
+            for key, value in batch.items():
+                self._dirty.setdefault(key, value)
+
+    async def flush(self) -> None:
+        if self._write_task is not None and not self._write_task.done():
+            await self._write_task
+        await self._write_dirty()
+
+    # ───────────────────────── чтение ─────────────────────────
+
+    async def get_user_data(self) -> dict:
+        data = await asyncio.to_thread(self._load, _USER)
+        return {int(key): value for key, value in data.items()}
+
+    async def get_chat_data(self) -> dict:
+        data = await asyncio.to_thread(self._load, _CHAT)
+        return {int(key): value for key, value in data.items()}
+
+    async def get_bot_data(self) -> dict:
+        data = await asyncio.to_thread(self._load, _BOT)
+        return data.get("0", {})
+
+    async def get_callback_data(self):
+        data = await asyncio.to_thread(self._load, _CALLBACK)
+        return data.get("0")
+
+    async def get_conversations(self, name: str) -> dict:
+        data = await asyncio.to_thread(self._load, _conversation_namespace(name))
+        return {tuple(json.loads(key)): state for key, state in data.items()}
+
+    # ───────────────────────── запись ─────────────────────────
+
+    async def update_user_data(self, user_id: int, data) -> None:
+        self._mark(_USER, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        self._mark(_CHAT, chat_id, data)
+
+    async def update_bot_data(self, data) -> None:
+        self._mark(_BOT, 0, data)
+
+    async def update_callback_data(self, data) -> None:
+        self._mark(_CALLBACK, 0, data)
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        self._mark(_conversation_namespace(name), json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark(_USER, user_id, None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark(_CHAT, chat_id, None)
+
+    async def refresh_user_data(self, user_id: int, user_data) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+class SQLitePersistence(WriteBehindPersistence):
+    """Одна таблица SQLite (namespace, key) → pickle"""
+
+    storage_errors = (sqlite3.Error,)
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._db = None
+
+    # ───────────────────────── SQLite ─────────────────────────
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _load(self, namespace: str) -> dict[str, object]:
+        with self._db_lock:
+            rows = self._connect().execute(
+                "SELECT key, value FROM state WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def _write_batch(self, batch: dict[tuple[str, str], bytes | None]) -> None:
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                    [(ns, key, value) for (ns, key), value in batch.items() if value is not None]
+                )
+                db.executemany(
+                    "DELETE FROM state WHERE namespace = ? AND key = ?",
+                    [(ns, key) for (ns, key), value in batch.items() if value is None]
+                )
+
+class SupabasePersistence(WriteBehindPersistence):
+    """Таблица bot_state в Supabase: (namespace, key) → pickle в base64"""
+
+    storage_errors = (APIError, httpx.HTTPError)
+    PAGE_SIZE = 1000
+
+    def __init__(self, client, table: str = "bot_state", **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.table = table
+
+    def _load(self, namespace: str) -> dict[str, object]:
+        data: dict[str, object] = {}
+        after = None
+        while True:
+            # keyset-пагинация: PostgREST отдаёт не больше PAGE_SIZE строк за запрос
+            q = self.client.table(self.table).select("key, value").eq("namespace", namespace)
+            if after is not None:
+                q = q.gt("key", after)
+            rows = q.order("key").limit(self.PAGE_SIZE).execute().data or []
+            for row in rows:
+                data[row["key"]] = pickle.loads(base64.b64decode(row["value"]))
+            if len(rows) < self.PAGE_SIZE:
+                return data
+            after = rows[-1]["key"]
+
+    def _write_batch(self, batch: dict[tuple[str, str], bytes | None]) -> None:
+        upserts = [
+            {"namespace": ns, "key": key, "value": base64.b64encode(value).decode("ascii")}
+            for (ns, key), value in batch.items() if value is not None
+        ]
+        if upserts:
+            self.client.table(self.table).upsert(upserts, on_conflict="namespace,key").execute()
+        deletes = sorted(key for key, value in batch.items() if value is None)
+        for ns, keys in groupby(deletes, key=lambda k: k[0]):
+            self.client.table(self.table).delete().eq("namespace", ns).in_("key", [key for _, key in keys]).execute()
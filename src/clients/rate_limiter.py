@@ -0,0 +1,186 @@
+"""
+Ограничение исходящих запросов к Telegram 🚦
+────────────────────────────────────────────
+TelegramRateLimiter – реализация BaseRateLimiter из python-telegram-bot,
+через которую проходят все запросы бота:
+• token bucket на весь бот (TG_GLOBAL_RATE сообщений/с) и на каждый чат
+  (TG_CHAT_RATE сообщений/с, в группах — TG_GROUP_RATE)
+• очередь с приоритетами: ответы пользователям идут раньше рассылок
+• при RetryAfter все отправки приостанавливаются на указанное время,
+  запрос повторяется (до TG_MAX_RETRIES раз)
+
+Рассылки помечаются контекстом:
+    with broadcast_priority():
+        await bot.send_message(...)
+или явно: bot.send_message(..., rate_limit_args={"priority": PRIORITY_BROADCAST})
+
+Запросы без chat_id (getUpdates, getFile, setWebhook…) не ограничиваются,
+но RetryAfter для них тоже обрабатывается.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from clients.metrics import SEND_QUEUE_DEPTH
+
+log = logging.getLogger(__name__)
+
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "25"))
+TG_GLOBAL_BURST = float(os.getenv("TG_GLOBAL_BURST", "25"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", "3"))
+TG_GROUP_RATE = float(os.getenv("TG_GROUP_RATE", str(20 / 60)))
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "3"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BROADCAST = 10
+
+# Сколько корзин чатов держать, прежде чем чистить простаивающие
+_MAX_CHAT_BUCKETS = 10_000
+
+_priority: ContextVar[int] = ContextVar("telegram_send_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def broadcast_priority():
+    """Все отправки внутри блока (и в задачах, созданных в нём) идут с приоритетом рассылки"""
+    token = _priority.set(PRIORITY_BROADCAST)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity накоплено"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Сколько ждать до появления токена (0 — можно сейчас)"""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        """Берёт токен в долг и возвращает, сколько ждать до его появления"""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class TelegramRateLimiter(BaseRateLimiter[dict]):
+    """Глобальный и по-чатовый token bucket с приоритетной очередью и обработкой RetryAfter"""
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = TG_GLOBAL_RATE,
+        global_burst: float = TG_GLOBAL_BURST,
+        chat_rate: float = TG_CHAT_RATE,
+        chat_burst: float = TG_CHAT_BURST,
+        group_rate: float = TG_GROUP_RATE,
+        max_retries: int = TG_MAX_RETRIES,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._waiting: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._dispatcher: asyncio.Task | None = None
+        SEND_QUEUE_DEPTH.set_function(lambda: len(self._waiting))
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        for _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+
+    # ───────────────────────── лимиты ─────────────────────────
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle}
+            is_group = isinstance(chat_id, str) or int(chat_id) < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1 if is_group else self.chat_burst)
+        return bucket
+
+    async def _acquire_global(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        """Выдаёт глобальные токены ожидающим запросам в порядке приоритета"""
+        while self._waiting:
+            wait = max(self._global.wait_time(), self._paused_until - time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                self._global.take()
+                future.set_result(None)
+
+    # ───────────────────────── обработка запроса ─────────────────────────
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        priority = (rate_limit_args or {}).get("priority", _priority.get())
+
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                delay = self._chat_bucket(chat_id).reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                await self._acquire_global(priority)
+            else:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                log.warning("⚠️ Telegram flood control on %s (chat %s): pausing sends for %ss",
+                            endpoint, chat_id, retry_after)
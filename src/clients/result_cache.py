@@ -0,0 +1,157 @@
+"""
+Кэш результатов с LRU в памяти и SQLite на диске 🗄️
+────────────────────────────────────────────────────
+• get / put по строковому ключу, значения — JSON-совместимые объекты;
+  aget / aput — для event loop: память проверяется сразу, SQLite — в потоке
+• в памяти — LRU на memory_size записей (ответ за микросекунды)
+• на диске — таблица SQLite с TTL и ограничением по числу строк
+  (при переполнении удаляются давно не использованные записи; проверка —
+  раз в EVICT_EVERY записей, поэтому строк может быть чуть больше max_rows)
+• счётчики попаданий/промахов для мониторинга
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# Как часто (в записях) проверять TTL и max_rows на диске
+EVICT_EVERY = 100
+
+
+class ResultCache:
+    """LRU-кэш в памяти поверх персистентного SQLite-хранилища"""
+
+    def __init__(self, path: str, *, ttl: float, max_rows: int, memory_size: int = 512):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.memory_size = memory_size
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        # Память и диск под разными блокировками: медленный SQLite в потоке
+        # не задерживает проверку памяти в event loop
+        self._memory_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._puts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает БД при первом обращении"""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    # ───────────────────────── память ─────────────────────────
+
+    def _remember(self, key: str, created_at: float, value) -> None:
+        with self._memory_lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _get_memory(self, key: str, now: float):
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+            self._memory.pop(key, None)
+            return None
+
+    # ───────────────────────── диск ─────────────────────────
+
+    def _get_disk(self, key: str, now: float):
+        with self._db_lock:
+            try:
+                db = self._connect()
+                row = db.execute(
+                    "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.stats["disk_hits"] += 1
+                    return value
+                if row:
+                    db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    db.commit()
+            except sqlite3.Error as e:
+                log.warning("⚠️ Result cache read failed: %s", e)
+
+            self.stats["misses"] += 1
+            return None
+
+    def _put_disk(self, key: str, value, now: float) -> None:
+        with self._db_lock:
+            try:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                self._puts += 1
+                if self._puts % EVICT_EVERY == 0:
+                    self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                log.warning("⚠️ Result cache write failed: %s", e)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Удаляет просроченные записи и самые старые сверх max_rows"""
+        db.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        (count,) = db.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_rows:
+            db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_rows,)
+            )
+
+    # ───────────────────────── API ─────────────────────────
+
+    def get(self, key: str):
+        """Возвращает сохранённое значение или None (блокирует на время чтения SQLite)"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        return value if value is not None else self._get_disk(key, now)
+
+    def put(self, key: str, value) -> None:
+        """Сохраняет значение в памяти и на диске (блокирует на время записи SQLite)"""
+        now = time.time()
+        self._remember(key, now, value)
+        self._put_disk(key, value, now)
+
+    async def aget(self, key: str):
+        """get для event loop: промах памяти читается с диска в потоке"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    async def aput(self, key: str, value) -> None:
+        """put для event loop: запись на диск — в потоке"""
+        now = time.time()
+        self._remember(key, now, value)
+        await asyncio.to_thread(self._put_disk, key, value, now)
@@ -0,0 +1,111 @@
+"""
+Асинхронный слой доступа к Supabase 💾
+──────────────────────────────────────
+Те же функции, что и в supabase_client, но awaitable.
+Синхронные PostgREST-запросы выполняются в ограниченном пуле потоков,
+поэтому медленный ответ Supabase не блокирует event loop бота и запросы
+разных пользователей идут параллельно.
+
+Размер пула задаётся переменной окружения SUPABASE_MAX_WORKERS (по умолчанию 16).
+Время каждого запроса пишется в метрику bot_external_call_seconds{service="supabase"}.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import supabase_client as _sync
+from clients.metrics import SUPABASE_QUEUE_DEPTH, timed
+
+SUPABASE_MAX_WORKERS = int(os.getenv("SUPABASE_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=SUPABASE_MAX_WORKERS,
+    thread_name_prefix="supabase"
+)
+class _Queued:
+    """Учитывает задачу в SUPABASE_QUEUE_DEPTH, пока она не взята потоком (или отменена до старта)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting = True
+        SUPABASE_QUEUE_DEPTH.inc()
+
+    def done(self) -> None:
+        with self._lock:
+            if self._waiting:
+                self._waiting = False
+                SUPABASE_QUEUE_DEPTH.dec()
+
+async def run_sync(func, *args, **kwargs):
+    """Выполняет синхронную функцию в пуле потоков Supabase"""
+    loop = asyncio.get_running_loop()
+    queued = _Queued()
+
+    def job():
+        queued.done()
+        return func(*args, **kwargs)
+
+    try:
+        return await loop.run_in_executor(_executor, job)
+    finally:
+        queued.done()
+
+def _to_async(func):
+    # Время меряется внутри потока, без ожидания свободного воркера
+    func = timed("supabase")(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_sync(func, *args, **kwargs)
+    return wrapper
+
+# ───────────────────────── users ─────────────────────────
+user_exists = _to_async(_sync.user_exists)
+save_user_data = _to_async(_sync.save_user_data)
+set_deficit_mode = _to_async(_sync.set_deficit_mode)
+get_user_profile = _to_async(_sync.get_user_profile)
+get_user_targets = _to_async(_sync.get_user_targets)
+get_user_ids_page = _to_async(_sync.get_user_ids_page)
+
+# ───────────────────────── weight / steps ─────────────────────────
+get_last_weight = _to_async(_sync.get_last_weight)
+save_weight = _to_async(_sync.save_weight)
+save_steps = _to_async(_sync.save_steps)
+save_daily_values_bulk = _to_async(_sync.save_daily_values_bulk)
+get_steps_for_date = _to_async(_sync.get_steps_for_date)
+steps_exist_for_date = _to_async(_sync.steps_exist_for_date)
+
+# ───────────────────────── meals / nutrition ─────────────────────────
+save_meal = _to_async(_sync.save_meal)
+get_nutrition_for_date = _to_async(_sync.get_nutrition_for_date)
+save_burned_calories = _to_async(_sync.save_burned_calories)
+get_burned_calories = _to_async(_sync.get_burned_calories)
+get_meals_for_date = _to_async(_sync.get_meals_for_date)
+delete_meal = _to_async(_sync.delete_meal)
+get_meal_by_id = _to_async(_sync.get_meal_by_id)
+has_meals_in_timerange = _to_async(_sync.has_meals_in_timerange)
+
+# ───────────────────────── storage ─────────────────────────
+get_image_url = _to_async(_sync.get_image_url)
+init_storage = _to_async(_sync.init_storage)
+check_connection = _to_async(_sync.check_connection)
+
+# ───────────────────────── favorite meals ─────────────────────────
+save_favorite_meal = _to_async(_sync.save_favorite_meal)
+get_favorite_meals = _to_async(_sync.get_favorite_meals)
+use_favorite_meal = _to_async(_sync.use_favorite_meal)
+delete_favorite_meal = _to_async(_sync.delete_favorite_meal)
+
+__all__ = [
+    "run_sync",
+    "save_meal", "save_weight", "save_steps", "save_daily_values_bulk", "get_last_weight",
+    "get_nutrition_for_date", "get_steps_for_date", "steps_exist_for_date",
+    "user_exists", "save_user_data", "get_user_targets", "get_user_profile",
+    "save_burned_calories", "get_burned_calories",
+    "get_meals_for_date", "delete_meal", "get_meal_by_id",
+    "save_favorite_meal", "get_favorite_meals", "use_favorite_meal", "delete_favorite_meal",
+    "init_storage", "get_image_url", "set_deficit_mode",
+    "has_meals_in_timerange", "check_connection", "get_user_ids_page"
+]
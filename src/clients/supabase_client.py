@@ -4,9 +4,12 @@
 • user_exists, save_user_data, get_user_profile
 • get_user_targets  – расчёт дневной нормы по LBM
 • save_weight / save_steps  (+steps_exist_for_date, get_steps_for_date)
+• save_daily_values_bulk – массовый upsert веса/шагов/сожжённых ккал
 • save_meal  – сохраняет калории/БЖУ блюда
 • get_nutrition_for_date – суммирует еду за дату
 • save_burned_calories / get_burned_calories – сохраняет/получает сожженные калории
+• check_connection / get_user_ids_page – проверка подключения и постраничная
+  загрузка пользователей после старта (при импорте модуля сеть не используется)
 
 Структура таблиц (минимум):
 ┌──────────────── users ────────────────┐   ┌──────────── meals ────────────┐
@@ -26,36 +29,70 @@
 │ date date                             │   │    | steps integer            │
 │ calories integer                      │   │                               │
 └───────────────────────────────────────┘   └───────────────────────────────┘
+
+┌─────────── daily_nutrition ───────────┐
+│ user_id text, date date (PK)          │   дневные итоги по meals,
+│ calories, protein, fat, carbs         │   обновляются триггером
+│ meal_count integer                    │   (sql/001_daily_nutrition.sql)
+└───────────────────────────────────────┘
 """
+import logging
 import os
+import threading
+import time
 from datetime import date
+from functools import lru_cache
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from postgrest.exceptions import APIError
 import base64
 from pathlib import Path
 
+from clients.log import log_sampled
+
+log = logging.getLogger(__name__)
+
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-print("🔍 DEBUG: Checking Supabase configuration")
-print(f"URL configured: {'Yes' if SUPABASE_URL else 'No'}")
-print(f"ANON_KEY configured: {'Yes' if SUPABASE_ANON_KEY else 'No'}")
-print(f"SERVICE_ROLE_KEY configured: {'Yes' if SUPABASE_SERVICE_ROLE_KEY else 'No'}")
+log.debug(
+    "Supabase configuration: url=%s anon_key=%s service_role_key=%s",
+    bool(SUPABASE_URL), bool(SUPABASE_ANON_KEY), bool(SUPABASE_SERVICE_ROLE_KEY)
+)
+
+class _LazyClient:
+    """Клиент Supabase, который создаётся при первом обращении — импорт модуля не трогает сеть"""
+
+    def __init__(self, key: str | None):
+        self._key = key
+        self._client: Client | None = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = create_client(SUPABASE_URL, self._key)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
 
-# Создаем клиенты
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Клиенты (anon и service_role для обхода RLS)
+supabase: Client = _LazyClient(SUPABASE_ANON_KEY)
+supabase_admin: Client = _LazyClient(SUPABASE_SERVICE_ROLE_KEY)
 
-# Проверяем подключение
-try:
-    # Пробуем получить список таблиц
-    tables = supabase.table("users").select("count").limit(1).execute()
-    print("✅ Supabase connection successful")
-except Exception as e:
-    print(f"❌ Supabase connection error: {e}")
+def check_connection() -> bool:
+    """Проверяет подключение к Supabase (вызывается после старта бота)"""
+    try:
+        supabase.table("users").select("user_id").limit(1).execute()
+        log.info("✅ Supabase connection successful")
+        return True
+    except Exception as e:
+        log.error("❌ Supabase connection error: %s", e)
+        return False
 
 # Константы для режимов дефицита
 DEFICIT_MODES = {
@@ -64,9 +101,50 @@ DEFICIT_MODES = {
     "Экстремальный": 750
 }
 
+# ───────────────────────── data versions ─────────────────────────
+# Счётчик изменений данных пользователя в этом процессе.
+# Увеличивается при каждой записи — по нему инвалидируются кэши графиков.
+_data_versions: dict[str, int] = {}
+
+def get_data_version(user_id: int) -> int:
+    return _data_versions.get(str(user_id), 0)
+
+def _bump_data_version(user_id) -> None:
+    key = str(user_id)
+    _data_versions[key] = _data_versions.get(key, 0) + 1
+
 # ───────────────────────── users helpers ─────────────────────────
+# Профили пользователей кэшируются в процессе на PROFILE_CACHE_TTL секунд;
+# save_user_data и set_deficit_mode обновляют кэш сразу после записи в Supabase,
+# правки в обход бота (вручную в БД) подхватываются после истечения TTL.
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+_PROFILE_FIELDS = ("weight", "height", "bodyfat", "gender", "deficit")
+_profile_cache: dict[str, tuple[float, dict]] = {}
+_profile_lock = threading.Lock()
+
+def _cache_profile(user_id, profile: dict) -> None:
+    with _profile_lock:
+        _profile_cache[str(user_id)] = (
+            time.monotonic() + PROFILE_CACHE_TTL,
+            {k: profile.get(k) for k in _PROFILE_FIELDS},
+        )
+
+def _cached_profile(user_id) -> dict | None:
+    """Копия профиля из кэша или None, если записи нет или она устарела"""
+    key = str(user_id)
+    with _profile_lock:
+        entry = _profile_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, profile = entry
+        if expires_at <= time.monotonic():
+            del _profile_cache[key]
+            return None
+        return dict(profile)
 
 def user_exists(user_id: int) -> bool:
+    if _cached_profile(user_id) is not None:
+        return True
     res = supabase.table("users").select("id").eq("user_id", str(user_id)).execute()
     return bool(res.data)
 
@@ -81,12 +159,14 @@ def save_user_data(user_id: int, weight: float, height: int, bodyfat: float, gen
             "gender": gender,
             "deficit": DEFICIT_MODES[deficit_mode]
         }
-        print(f"🔍 DEBUG: Saving user data for {user_id}: {payload}")
+        log.debug("Saving user data for %s: %s", user_id, payload)
         result = supabase.table("users").upsert(payload, on_conflict="user_id").execute()
-        print(f"✅ User data saved successfully: {result.data}")
+        _cache_profile(user_id, payload)
+        _bump_data_version(user_id)
+        log.debug("User data saved: %s", result.data)
         return True
-    except Exception as e:
-        print(f"❌ Failed to save user data: {e}")
+    except Exception:
+        log.exception("❌ Failed to save user data for %s", user_id)
         return False
 
 def set_deficit_mode(user_id: int, mode: str) -> None:
@@ -98,31 +178,47 @@ def set_deficit_mode(user_id: int, mode: str) -> None:
     
     try:
         # Verify user exists
-        current = supabase.table("users").select("*").eq("user_id", str(user_id)).single().execute()
-        if not current.data:
+        current = get_user_profile(user_id)
+        if not current:
             raise ValueError(f"User {user_id} not found in database")
         
         # Update deficit
         supabase.table("users").update({
             "deficit": deficit
         }).eq("user_id", str(user_id)).execute()
+        _cache_profile(user_id, {**current, "deficit": deficit})
+        _bump_data_version(user_id)
             
     except Exception as e:
-        print(f"❌ Failed to update deficit: {e}")
+        log.error("❌ Failed to update deficit for %s: %s", user_id, e)
         raise
 
+def get_user_ids_page(after: str | None = None, limit: int = 1000) -> list[str]:
+    """Страница user_id по возрастанию (keyset-пагинация: after — последний id прошлой страницы)"""
+    q = supabase.table("users").select("user_id")
+    if after is not None:
+        q = q.gt("user_id", after)
+    res = q.order("user_id").limit(limit).execute()
+    return [row["user_id"] for row in res.data or []]
+
 def get_user_profile(user_id: int):
+    cached = _cached_profile(user_id)
+    if cached:
+        return cached
     try:
         res = supabase.table("users").select("weight, height, bodyfat, gender, deficit").eq("user_id", str(user_id)).single().execute()
-        return res.data if res.data else None
+        if not res.data:
+            return None
+        _cache_profile(user_id, res.data)
+        return dict(res.data)
     except Exception as e:
-        print(f"❌ Failed to get user profile: {e}")
+        log.warning("❌ Failed to get user profile for %s: %s", user_id, e)
         return None
 
 # ───────────── дневная норма (lean‑mass based) ─────────────
 
-def _calc_targets(weight: float, bodyfat: float, deficit: int = 0):
-    """Рассчитывает цели на основе сухой массы тела и дефицита"""
+@lru_cache(maxsize=4096)
+def _calc_targets_cached(weight: float, bodyfat: float, deficit: int) -> tuple:
     lean = weight * (1 - bodyfat / 100)
     base_cal = round(lean * 30)
     cal = base_cal - deficit
@@ -130,6 +226,11 @@ def _calc_targets(weight: float, bodyfat: float, deficit: int = 0):
     fat = round(lean * 1)
     carbs = max(0, round((cal - protein * 4 - fat * 9) / 4))
     
+    return cal, protein, fat, carbs
+
+def _calc_targets(weight: float, bodyfat: float, deficit: int = 0):
+    """Рассчитывает цели на основе сухой массы тела и дефицита"""
+    cal, protein, fat, carbs = _calc_targets_cached(weight, bodyfat, deficit)
     return {"calories": cal, "protein": protein, "fat": fat, "carbs": carbs}
 
 def get_user_targets(user_id: int):
@@ -160,20 +261,57 @@ def _get_record(user_id: int, d: date):
     res = supabase.table("Nutrition Bot").select("id, weight, steps").eq("user_id", str(user_id)).eq("date", str(d)).execute()
     return res.data[0] if res.data else None
 
+# Один запрос upsert по уникальному ключу (user_id, date), см. sql/002_daily_unique_keys.sql.
+# PostgREST обновляет только переданные колонки, поэтому вес и шаги не затирают друг друга.
 def save_weight(user_id: int, weight: float, *, date: date):
-    rec = _get_record(user_id, date)
-    if rec:
-        supabase.table("Nutrition Bot").update({"weight": weight}).eq("id", rec['id']).execute()
-    else:
-        supabase.table("Nutrition Bot").insert({"user_id": str(user_id), "date": str(date), "weight": weight}).execute()
+    supabase.table("Nutrition Bot").upsert(
+        {"user_id": str(user_id), "date": str(date), "weight": weight},
+        on_conflict="user_id,date"
+    ).execute()
+    _bump_data_version(user_id)
 
 
 def save_steps(user_id: int, steps: int, *, date: date):
-    rec = _get_record(user_id, date)
-    if rec:
-        supabase.table("Nutrition Bot").update({"steps": steps}).eq("id", rec['id']).execute()
-    else:
-        supabase.table("Nutrition Bot").insert({"user_id": str(user_id), "date": str(date), "steps": steps}).execute()
+    supabase.table("Nutrition Bot").upsert(
+        {"user_id": str(user_id), "date": str(date), "steps": steps},
+        on_conflict="user_id,date"
+    ).execute()
+    _bump_data_version(user_id)
+
+
+# Вид значения → (таблица, колонка) для массовой записи
+DAILY_VALUE_COLUMNS = {
+    "weight": ("Nutrition Bot", "weight"),
+    "steps": ("Nutrition Bot", "steps"),
+    "burned_calories": ("burned_calories", "calories"),
+}
+BULK_CHUNK_SIZE = 1000
+
+def save_daily_values_bulk(kind: str, rows) -> int:
+    """
+    Массово сохраняет значения за день (для импорта и восстановления данных).
+    rows – итерируемое из (user_id, date, value); на каждые BULK_CHUNK_SIZE строк – один upsert.
+    Возвращает число сохранённых строк.
+    """
+    if kind not in DAILY_VALUE_COLUMNS:
+        raise ValueError(f"Неизвестный вид значения: {kind}")
+    table, column = DAILY_VALUE_COLUMNS[kind]
+
+    # Повтор одного ключа в одном upsert Postgres не допускает — оставляем последнее значение
+    payload = {}
+    for user_id, d, value in rows:
+        payload[(str(user_id), str(d))] = value
+    records = [
+        {"user_id": user_id, "date": d, column: value}
+        for (user_id, d), value in payload.items()
+    ]
+
+    for i in range(0, len(records), BULK_CHUNK_SIZE):
+        supabase.table(table).upsert(records[i:i + BULK_CHUNK_SIZE], on_conflict="user_id,date").execute()
+
+    for user_id in {r["user_id"] for r in records}:
+        _bump_data_version(user_id)
+    return len(records)
 
 
 def get_steps_for_date(user_id: int, d: date):
@@ -187,8 +325,30 @@ def steps_exist_for_date(user_id: int, d: date) -> bool:
 
 # ───────────────────────── Meals / Nutrition ───────────────────
 
+# Кэш дневных итогов в процессе: (user_id, date) → (срок, итоги из daily_nutrition).
+# Записи этого процесса сбрасывают его сразу, изменения в обход процесса (второй
+# дино, ручные правки, бэкфилл) подхватываются через NUTRITION_CACHE_TTL секунд.
+NUTRITION_CACHE_SIZE = int(os.getenv("NUTRITION_CACHE_SIZE", "10000"))
+NUTRITION_CACHE_TTL = float(os.getenv("NUTRITION_CACHE_TTL", "300"))
+_nutrition_cache: dict[tuple[str, str], tuple[float, dict]] = {}
+_nutrition_lock = threading.Lock()
+
+def reset_caches() -> None:
+    """Сбрасывает все кэши данных пользователей в процессе: профили, итоги дней, нормы"""
+    with _profile_lock:
+        _profile_cache.clear()
+    with _nutrition_lock:
+        _nutrition_cache.clear()
+    _calc_targets_cached.cache_clear()
+
+def _invalidate_nutrition(user_id, d) -> None:
+    """Сбрасывает итоги дня после записи/удаления еды и увеличивает версию данных"""
+    with _nutrition_lock:
+        _nutrition_cache.pop((str(user_id), str(d)), None)
+        _bump_data_version(user_id)
+
 def save_meal(user_id: int, desc: str, cal: int, prot: float, fat: float, carbs: float):
-    supabase.table("meals").insert({
+    meal = {
         "user_id": str(user_id),
         "date": str(date.today()),
         "description": desc,
@@ -196,45 +356,73 @@ def save_meal(user_id: int, desc: str, cal: int, prot: float, fat: float, carbs:
         "protein": prot,
         "fat": fat,
         "carbs": carbs,
-    }).execute()
+    }
+    # daily_nutrition обновляется триггером в той же транзакции
+    supabase.table("meals").insert(meal).execute()
+    _invalidate_nutrition(user_id, meal["date"])
 
+def _load_daily_nutrition(user_id: int, d: date) -> dict:
+    """Читает строку итогов за день (или суммирует meals, если таблицы итогов нет)"""
+    try:
+        res = supabase.table("daily_nutrition").select("calories, protein, fat, carbs, meal_count") \
+            .eq("user_id", str(user_id)).eq("date", str(d)).execute()
+        if res.data:
+            row = res.data[0]
+            return {
+                "calories": row["calories"] or 0,
+                "protein": float(row["protein"] or 0),
+                "fat": float(row["fat"] or 0),
+                "carbs": float(row["carbs"] or 0),
+                "meal_count": row["meal_count"] or 0,
+            }
+        return {"calories": 0, "protein": 0.0, "fat": 0.0, "carbs": 0.0, "meal_count": 0}
+    except APIError as e:
+        log.warning("⚠️ daily_nutrition unavailable, summing meals: %s", e)
 
-def get_nutrition_for_date(user_id: int, d: date):
     res = supabase.table("meals").select("calories, protein, fat, carbs").eq("user_id", str(user_id)).eq("date", str(d)).execute()
-    if not res.data:
-        return None
-    total = {"calories": 0, "protein": 0.0, "fat": 0.0, "carbs": 0.0}
-    for r in res.data:
+    total = {"calories": 0, "protein": 0.0, "fat": 0.0, "carbs": 0.0, "meal_count": len(res.data or [])}
+    for r in res.data or []:
         total["calories"] += r.get("calories") or 0
         total["protein"] += r.get("protein") or 0
         total["fat"]     += r.get("fat") or 0
         total["carbs"]   += r.get("carbs") or 0
     return total
 
+def get_nutrition_for_date(user_id: int, d: date):
+    key = (str(user_id), str(d))
+    total = None
+    with _nutrition_lock:
+        entry = _nutrition_cache.get(key)
+        if entry is not None:
+            expires_at, total = entry
+            if expires_at <= time.monotonic():
+                del _nutrition_cache[key]
+                total = None
+        version = get_data_version(user_id)
+    if total is None:
+        total = _load_daily_nutrition(user_id, d)
+        with _nutrition_lock:
+            # Если за время запроса была запись — результат мог устареть, не кэшируем
+            if get_data_version(user_id) == version:
+                _nutrition_cache[key] = (time.monotonic() + NUTRITION_CACHE_TTL, total)
+                if len(_nutrition_cache) > NUTRITION_CACHE_SIZE:
+                    _nutrition_cache.pop(next(iter(_nutrition_cache)))
+
+    if total["meal_count"] <= 0:
+        return None
+    return {k: total[k] for k in ("calories", "protein", "fat", "carbs")}
+
 def save_burned_calories(user_id: int, calories: int, date: date) -> None:
     """Сохраняет сожженные калории за день"""
     try:
-        # Проверяем, есть ли уже запись за этот день
-        res = supabase.table("burned_calories").select("id") \
-            .eq("user_id", str(user_id)) \
-            .eq("date", str(date)) \
-            .execute()
-        
-        if res.data:
-            # Обновляем существующую запись
-            supabase.table("burned_calories") \
-                .update({"calories": calories}) \
-                .eq("id", res.data[0]["id"]) \
-                .execute()
-        else:
-            # Создаем новую запись
-            supabase.table("burned_calories").insert({
-                "user_id": str(user_id),
-                "date": str(date),
-                "calories": calories
-            }).execute()
+        supabase.table("burned_calories").upsert({
+            "user_id": str(user_id),
+            "date": str(date),
+            "calories": calories
+        }, on_conflict="user_id,date").execute()
+        _bump_data_version(user_id)
     except APIError as e:
-        print(f"❌ Failed to save burned calories: {e}")
+        log.error("❌ Failed to save burned calories for %s: %s", user_id, e)
 
 def get_burned_calories(user_id: int, date: date) -> int:
     """Возвращает сожженные калории за день"""
@@ -245,55 +433,43 @@ def get_burned_calories(user_id: int, date: date) -> int:
             .execute()
         return res.data[0]["calories"] if res.data else 0
     except APIError as e:
-        print(f"❌ Failed to get burned calories: {e}")
+        log.error("❌ Failed to get burned calories for %s: %s", user_id, e)
         return 0
 
 #-------------------------- Delete Meal --------------------------
 def get_meals_for_date(user_id: int, d: date):
     """Получает список всех приемов пищи за день с ID"""
     try:
-        print(f"🔍 DEBUG: Getting meals for user {user_id} on {d}")
-        
         res = supabase.table("meals").select("id, description, calories, protein, fat, carbs, created_at") \
             .eq("user_id", str(user_id)) \
             .eq("date", str(d)) \
             .order("created_at", desc=False) \
             .execute()
             
-        print(f"🔍 DEBUG: Raw meals data: {res.data}")
-        
-        if res.data:
-            for i, meal in enumerate(res.data):
-                print(f"🔍 DEBUG: Meal {i+1} - ID: {meal['id']} (type: {type(meal['id'])})")
-                print(f"🔍 DEBUG: Meal {i+1} - Description: {meal['description']}")
-        
+        log_sampled(log, "get_meals_for_date", "Meals for user %s on %s: %s", user_id, d, res.data)
         return res.data if res.data else []
-    except Exception as e:
-        print(f"❌ Failed to get meals for date: {e}")
-        import traceback
-        print(f"❌ Full traceback: {traceback.format_exc()}")
+    except Exception:
+        log.exception("❌ Failed to get meals for user %s on %s", user_id, d)
         return []
 
 def delete_meal(meal_id: str) -> bool:
     """Удаляет прием пищи по ID с использованием service_role для обхода RLS"""
     try:
-        print(f"🔍 DEBUG: Attempting to delete meal with ID: {meal_id}")
-        
         # Используем service_role клиент для обхода RLS
         delete_result = supabase_admin.table("meals").delete().eq("id", meal_id).execute()
-        print(f"🔍 DEBUG: Delete result: {delete_result}")
-        print(f"🔍 DEBUG: Deleted data: {delete_result.data}")
-        
+        log_sampled(log, "delete_meal", "Delete meal %s result: %s", meal_id, delete_result.data)
+
         # Проверяем успешность по количеству удаленных записей
         success = delete_result.data is not None and len(delete_result.data) > 0
-        print(f"✅ DELETE SUCCESS: {success}")
+        log.info("🗑️ Meal %s deleted: %s", meal_id, success)
+        if success:
+            deleted = delete_result.data[0]
+            _invalidate_nutrition(deleted["user_id"], deleted["date"])
         
         return success
         
-    except Exception as e:
-        print(f"❌ Failed to delete meal: {e}")
-        import traceback
-        print(f"❌ Full traceback: {traceback.format_exc()}")
+    except Exception:
+        log.exception("❌ Failed to delete meal %s", meal_id)
         return False
 
 def get_meal_by_id(meal_id: str):
@@ -302,21 +478,19 @@ def get_meal_by_id(meal_id: str):
         res = supabase.table("meals").select("*").eq("id", meal_id).single().execute()
         return res.data if res.data else None
     except Exception as e:
-        print(f"❌ Failed to get meal by ID: {e}")
+        log.error("❌ Failed to get meal %s: %s", meal_id, e)
         return None
     
 # ───────────────────────── Images Storage ───────────────────────
 def get_image_url(file_name: str) -> str:
     """Получает приватный URL картинки с токеном доступа"""
     try:
-        print(f"🔍 DEBUG: Getting signed URL for {file_name}")
         # Получаем signed URL с ограниченным временем действия (24 часа)
         signed_url = supabase_admin.storage.from_('nutritionbot').create_signed_url(file_name, 86400)
-        print(f"✅ Got signed URL: {signed_url}")
+        log.debug("Got signed URL for %s", file_name)
         return signed_url['signedURL']
     except Exception as e:
-        print(f"⚠️ Failed to get image URL: {e}")
-        print(f"Error details: {str(e)}")
+        log.warning("⚠️ Failed to get image URL for %s: %s", file_name, e)
         return None
 
 def init_storage():
@@ -325,12 +499,11 @@ def init_storage():
         # Пробуем получить URL тестового изображения
         test_url = get_image_url('male-bodyfat.jpg')
         if test_url:
-            print("✅ Storage access successful")
+            log.info("✅ Storage access successful")
         else:
-            print("⚠️ Storage access failed")
+            log.warning("⚠️ Storage access failed")
     except Exception as e:
-        print(f"⚠️ Storage access warning: {e}")
-        print("ℹ️ Bot will continue working without image support")
+        log.warning("⚠️ Storage access warning: %s; bot will continue without image support", e)
 
 def upload_image(file_path: str, file_name: str):
     """Загружает картинку в Storage"""
@@ -344,8 +517,6 @@ def has_meals_in_timerange(user_id: int, d: date, start_hour: int, end_hour: int
         start_time = f"{d}T{start_hour:02d}:00:00"
         end_time = f"{d}T{end_hour:02d}:59:59"
         
-        print(f"🔍 DEBUG: Checking meals for user {user_id} between {start_time} and {end_time}")
-        
         # Проверяем наличие записей
         res = supabase.table("meals") \
             .select("id") \
@@ -355,11 +526,11 @@ def has_meals_in_timerange(user_id: int, d: date, start_hour: int, end_hour: int
             .execute()
         
         has_meals = bool(res.data)
-        print(f"✅ Found meals: {has_meals}")
+        log.debug("Meals for user %s between %s and %s: %s", user_id, start_time, end_time, has_meals)
         return has_meals
         
     except Exception as e:
-        print(f"❌ Error checking meals: {e}")
+        log.error("❌ Error checking meals for %s: %s", user_id, e)
         return False  # В случае ошибки считаем, что еды не было
     
     # ───────────────────────── Favorite Meals ─────────────────────────
@@ -374,7 +545,7 @@ def save_favorite_meal(user_id: int, name: str, description: str, calories: int,
             .execute()
         
         if existing.data:
-            print(f"⚠️ Favorite meal '{name}' already exists for user {user_id}")
+            log.info("Favorite meal '%s' already exists for user %s", name, user_id)
             return False
         
         # Сохраняем новое любимое блюдо
@@ -389,11 +560,11 @@ def save_favorite_meal(user_id: int, name: str, description: str, calories: int,
             "usage_count": 0
         }).execute()
         
-        print(f"✅ Saved favorite meal '{name}' for user {user_id}")
+        log.info("⭐ Saved favorite meal '%s' for user %s", name, user_id)
         return True
         
     except Exception as e:
-        print(f"❌ Failed to save favorite meal: {e}")
+        log.error("❌ Failed to save favorite meal for %s: %s", user_id, e)
         return False
 
 def get_favorite_meals(user_id: int):
@@ -406,7 +577,7 @@ def get_favorite_meals(user_id: int):
             .execute()
         return res.data if res.data else []
     except Exception as e:
-        print(f"❌ Failed to get favorite meals: {e}")
+        log.error("❌ Failed to get favorite meals for %s: %s", user_id, e)
         return []
 
 def use_favorite_meal(user_id: int, favorite_id: str) -> dict:
@@ -430,7 +601,7 @@ def use_favorite_meal(user_id: int, favorite_id: str) -> dict:
         return meal.data
         
     except Exception as e:
-        print(f"❌ Failed to use favorite meal: {e}")
+        log.error("❌ Failed to use favorite meal %s: %s", favorite_id, e)
         return None
 
 def delete_favorite_meal(user_id: int, favorite_id: str) -> bool:
@@ -442,7 +613,7 @@ def delete_favorite_meal(user_id: int, favorite_id: str) -> bool:
             .execute()
         return True
     except Exception as e:
-        print(f"❌ Failed to delete favorite meal: {e}")
+        log.error("❌ Failed to delete favorite meal %s: %s", favorite_id, e)
         return False
 
 # В самый конец файла:
@@ -454,5 +625,6 @@ __all__ = [
     "get_meals_for_date", "delete_meal", "get_meal_by_id",
     "save_favorite_meal", "get_favorite_meals", "use_favorite_meal", "delete_favorite_meal",  # НОВЫЕ ФУНКЦИИ
     "supabase", "init_storage", "get_image_url", "set_deficit_mode",
-    "has_meals_in_timerange"
+    "has_meals_in_timerange", "get_data_version", "save_daily_values_bulk",
+    "check_connection", "get_user_ids_page", "reset_caches"
 ]
@@ -0,0 +1,129 @@
+"""
+Webhook-режим бота 🌐
+─────────────────────
+Telegram присылает апдейты POST-запросами на локальный HTTP-сервер (aiohttp):
+• заголовок X-Telegram-Bot-Api-Secret-Token сверяется с WEBHOOK_SECRET
+• апдейты кладутся в ограниченную очередь приложения; если она заполнена,
+  отвечаем 503 — Telegram повторит доставку позже
+• по SIGTERM/SIGINT сервер перестаёт принимать запросы, уже принятые
+  апдейты дообрабатываются, затем приложение останавливается
+
+Настройки (переменные окружения):
+  WEBHOOK_URL        – публичный адрес, напр. https://my-bot.herokuapp.com
+                       (если не задан, setWebhook не вызывается — удобно для локальной проверки)
+  WEBHOOK_PATH       – путь для апдейтов, по умолчанию /telegram
+  WEBHOOK_SECRET     – секрет для проверки заголовка (обязателен)
+  WEBHOOK_LISTEN     – адрес для прослушивания, по умолчанию 0.0.0.0
+  PORT               – порт (Heroku задаёт сам), по умолчанию 8080
+  WEBHOOK_QUEUE_SIZE – размер очереди апдейтов, по умолчанию 256
+
+Там же GET /metrics – метрики Prometheus (см. clients/metrics.py), только
+если задан METRICS_TOKEN: порт публичный, без токена метрики доступны
+лишь через METRICS_PORT.
+
+Локальная проверка записанным апдейтом:
+  curl -X POST http://localhost:8080/telegram \
+       -H "Content-Type: application/json" \
+       -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \
+       -d @update.json
+"""
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from clients.metrics import METRICS_TOKEN, render_metrics
+
+log = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "256"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def create_web_app(application: Application) -> web.Application:
+    """aiohttp-приложение, которое принимает апдейты и кладёт их в очередь бота"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET or ""
+        ):
+            return web.Response(status=403)
+
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            log.warning("⚠️ Invalid webhook payload: %s", e)
+            return web.Response(status=400)
+
+        try:
+            application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            log.warning("⚠️ Update queue is full, asking Telegram to retry")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def metrics(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"
+        ):
+            return web.Response(status=401)
+        body, content_type = render_metrics()
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.router.add_get("/healthz", health)
+    if METRICS_TOKEN:
+        app.router.add_get("/metrics", metrics)
+    return app
+
+async def run_webhook(application: Application, *, allowed_updates=None) -> None:
+    """Запускает бота в webhook-режиме и ждёт сигнала остановки"""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET is required in webhook mode")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    runner = web.AppRunner(create_web_app(application))
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+    log.info("🌐 Webhook server listening on %s:%s%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates,
+        )
+
+    try:
+        await stop_event.wait()
+    finally:
+        log.info("🛑 Shutting down webhook server...")
+        # Сначала перестаём принимать апдейты, затем дообрабатываем очередь
+        await runner.cleanup()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)